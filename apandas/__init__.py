@@ -15,9 +15,9 @@
 - If analytic columns have not yet been added, they are calculated on-the-fly (including their dependencies if needed).
 - Accessed directly by analytic instances (to leverage intellisense support).
 
-At the moment, only basic arithmetic operations are supported - this is mostly a proof of concept. It should be
-easy to add support for other operations or for numpy universal functions. Most complicated functions can be
-passed in as lambdas or defined as functions.
+At the moment, basic arithmetic operations, some pd.Series methods (including reductions such as `sum`
+or `mean`), numpy universal functions, `np.where` and `np.clip` are supported - this is mostly a proof of concept.
+Most complicated functions can be passed in as lambdas or defined as functions.
 
 "APandas" stands for "Analytic Pandas".
 
@@ -62,7 +62,13 @@ At the moment, the library is available only on `test.pypi.org
 from .version import VERSION as __version__
 from .acolumn import AFunction, ANamedFunction, AColumn
 from .aframe import AFrame, ASeries
-
-__all__ = ['AFunction', 'ANamedFunction', 'AColumn', 'AFrame', 'ASeries']
+from .alazy import LazyAFrame
+from .acache import ACache
+from .adisk import ADiskCache
+from .astream import stream, write_stream
+from .aprofile import AProfiler, AColumnEvent, add_observer, remove_observer
+
+__all__ = ['AFunction', 'ANamedFunction', 'AColumn', 'AFrame', 'ASeries', 'LazyAFrame', 'ACache', 'ADiskCache',
+           'stream', 'write_stream', 'AProfiler', 'AColumnEvent', 'add_observer', 'remove_observer']
 __author__ = 'Tomas Protivinsky'
 
@@ -0,0 +1,124 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+POLICIES = ['lru', 'cost']
+
+
+class ACache:
+    """
+    Accounting of the derived AColumns calculated in an AFrame, with an optional memory budget. The columns are
+    still stored in the frame - when the budget is exceeded, the evicted columns are dropped from the frame and
+    they are calculated again transparently on the next access.
+
+    With the 'lru' policy, the least recently used columns are evicted first. With the 'cost' policy, the columns
+    that are cheap to recalculate relative to their size are evicted first (the least recently used first among
+    the equally cheap ones).
+    """
+    def __init__(self, max_bytes: Optional[int] = None, policy: str = 'lru'):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown policy {policy!r}, use one of {POLICIES}.')
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (entries of the cache this one has been copied from, names of the columns taken over), see `copy`
+        self._source = None
+        # if True, the entries are referred to by a copy of the cache, so they are copied before any change
+        self._shared = False
+
+    @property
+    def entries(self) -> OrderedDict:
+        """ Name -> (size in bytes, seconds spent on the calculation), ordered from the least recently used. """
+        if self._source is not None:
+            entries, names = self._source
+            self._entries = OrderedDict((name, entry) for name, entry in entries.items() if name in names)
+            self._nbytes = sum(nbytes for nbytes, _ in self._entries.values())
+            self._source = None
+        return self._entries
+
+    @property
+    def nbytes(self) -> int:
+        """ Size of the cached columns in bytes. """
+        self.entries
+        return self._nbytes
+
+    def _writable(self) -> OrderedDict:
+        """ The entries to be changed (copied if they are shared with a copy of the cache). """
+        entries = self.entries
+        if self._shared:
+            self._entries = entries = OrderedDict(entries)
+            self._shared = False
+        return entries
+
+    def copy(self, names: Iterable[str]) -> ACache:
+        """
+        Copy of the cache with the accounting of the columns `names` only (such as the columns of a copy of the frame),
+        so the caches do not evict each other's columns. The entries are copied lazily - on the first use of the copy,
+        or before the first change of this cache.
+        """
+        cache = ACache(max_bytes=self.max_bytes, policy=self.policy)
+        cache.hits, cache.misses, cache.evictions = self.hits, self.misses, self.evictions
+        if self._source is not None:
+            entries, kept = self._source
+            cache._source = (entries, kept.intersection(names))
+        else:
+            cache._source = (self._entries, set(names))
+            self._shared = True
+        return cache
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f'ACache[{len(self)} columns, {self.nbytes} bytes, max_bytes={self.max_bytes}, policy={self.policy!r}]'
+
+    @property
+    def stats(self) -> dict:
+        """ Number of hits, misses and evictions, and the number and the size of the cached columns. """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'columns': len(self), 'bytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+    def hit(self, name: str):
+        """ Record an access to an already calculated column. """
+        self.hits += 1
+        self._writable().move_to_end(name)
+
+    def add(self, name: str, nbytes: int, cost: float):
+        """ Record a newly calculated column of `nbytes` bytes that took `cost` seconds. """
+        self.misses += 1
+        self.discard(name)
+        self._writable()[name] = (nbytes, cost)
+        self._nbytes += nbytes
+
+    def discard(self, name: str):
+        """ Stop tracking the column (for instance when it is removed from the frame). """
+        if name in self.entries:
+            self._nbytes -= self._writable().pop(name)[0]
+
+    def to_evict(self, protected: Iterable[str] = ()) -> List[str]:
+        """
+        Choose the columns to evict to fit into the memory budget and stop tracking them. The `protected` columns
+        (typically the ones that have just been requested) are never evicted.
+        """
+        if self.max_bytes is None or self.nbytes <= self.max_bytes:
+            return []
+        protected = set(protected)
+        candidates = [name for name in self.entries if name not in protected]
+        if self.policy == 'cost':
+            # sorted is stable, so the least recently used go first among the columns of the same cost
+            candidates.sort(key=lambda name: self.entries[name][1] / max(self.entries[name][0], 1))
+        evicted = []
+        for name in candidates:
+            if self.nbytes <= self.max_bytes:
+                break
+            self.discard(name)
+            evicted.append(name)
+        self.evictions += len(evicted)
+        return evicted
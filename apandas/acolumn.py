@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import copy
 import functools
-from typing import Optional, Callable, Union, Any
+import itertools
+from typing import Optional, Callable, Union, Any, List
 import operator
+import numpy as np
 import pandas as pd
+from .anumpy import array_op, series_method, ARRAY_FUNCTIONS
 
 
 def _method_delegate(cls):
@@ -11,12 +15,14 @@ def _method_delegate(cls):
     A list of operators and pandas.Series methods that are leveraged to work correctly in on AFunctions
     (and AColumns) - the operators and methods are applied to the underlying pd.Series after the lookup
     of the AFunction (or AColumn) in the AFrame (and possibly after the application of other calculations).
+    The reductions (sum, mean...) result in scalars.
     """
 
     pd_series_methods = [
         '__add__', '__sub__', '__mul__', '__truediv__', '__floordiv__', '__mod__', '__pow__', '__matmul__',
         '__and__', '__or__', '__lt__', '__gt__', '__le__', '__ge__', '__eq__', '__ne__', '__abs__',
         'diff', 'round', 'fillna', 'replace', 'cumsum', 'cumprod',
+        'sum', 'prod', 'mean', 'median', 'min', 'max', 'std', 'var', 'count',
     ]
 
     for name in pd_series_methods:
@@ -33,25 +39,147 @@ def _method_delegate(cls):
     return cls
 
 
+class _StructKey(tuple):
+    """ Tuple with cached hash, so even the keys of deep expressions are hashed in constant time. """
+    def __new__(cls, items):
+        key = super().__new__(cls, items)
+        key._hash = super().__hash__(key)
+        return key
+
+    def __hash__(self):
+        return self._hash
+
+
+def _arg_key(x):
+    """ Structural key of an operand, unhashable objects (lists, arrays...) are compared by identity. """
+    if isinstance(x, AFunction):
+        return x.key
+    try:
+        hash(x)
+        return type(x), x
+    except TypeError:
+        return 'id', id(x)
+
+
 @_method_delegate
 class AFunction:
-    """ Represents any function that can be applied to an AFrame / pd.DataFrame. """
+    """
+    Represents any function that can be applied to an AFrame / pd.DataFrame.
+
+    Functions built from operators or delegated pd.Series methods also remember the operation (`op`) and its
+    operands (`args` and `kwargs`), so the dependencies are known without calling the function. So do numpy
+    ufuncs (`np.log(x)`, `np.maximum(x, y)`...), `np.where`, `np.clip` and the numpy functions that pandas
+    dispatches to pd.Series methods (`np.sum(x)` is `x.sum()`) called on AFunctions. Functions created
+    from arbitrary callables (lambdas) are opaque.
+    """
     def __init__(self, func: Union[Callable, Any]):
+        self.op = None
+        self.args = ()
+        self.kwargs = {}
+        self.engine = None
+        self.row_local = False
+        self._key = None
         # If func is not callable, treat it as a content to fill in.
         # Or do I want to provide a specific static function such as AFunction.content?
         if not callable(func) and func is not None:  # scalar or iterable content
             self.func = lambda _: func
         elif isinstance(func, AFunction) and func.func is not None:  # unwrap AFunction, to avoid unnecessary nesting
             self.func = func.func
+            self.op, self.args, self.kwargs = func.op, func.args, func.kwargs
+            self.engine = func.engine
+            self.row_local = func.row_local
         else:
             self.func = func
 
     def from_frame(self, af):
-        return self.func(af)
+        from .aeval import evaluate
+        return evaluate(self, af, engine=self.engine)
+
+    def compile(self, engine: str = 'numexpr') -> AFunction:
+        """
+        Return a copy of the function that evaluates its chains of elementwise arithmetic operations fused
+        in a single pass over the underlying numpy arrays, instead of creating a pd.Series for every intermediate
+        result. The `engine` is either 'numexpr' (falls back to 'numpy' if numexpr is not installed)
+        or 'numpy'. Operations that cannot be fused are still evaluated by pandas.
+        """
+        from .acompile import resolve_engine
+        resolve_engine(engine)
+        compiled = copy.copy(self)
+        compiled.engine = engine
+        return compiled
+
+    def rowwise(self) -> AFunction:
+        """
+        Return a copy of the (opaque) function that declares that every row of its result depends only
+        on the same row of the frame, so it can be calculated on subsets of rows (for instance in parallel
+        on row partitions, or after the filters in a LazyAFrame).
+        """
+        rowwise = copy.copy(self)
+        rowwise.row_local = True
+        return rowwise
+
+    def group_transform(self, func: str, by: Union[AFunction, str, List[Union[AFunction, str]]],
+                        **kwargs) -> AFunction:
+        """
+        Transformation `func` (such as 'sum', 'mean', 'rank' or any other name accepted by pandas groupby)
+        of the function within the groups given by the AColumns (or names of columns) `by`, aligned with the rows
+        of the frame - for instance the share of the group total is `x / x.group_sum(by=g)`.
+
+        The grouping is a node of the expression itself, so all the grouped AFunctions with the same keys
+        evaluated together share a single factorization of the keys (and a single sort of the rows by the groups).
+        """
+        from .agroup import grouping, group_transform
+        by = [by] if isinstance(by, (AFunction, str)) else by
+        by = [AColumn(x) if isinstance(x, str) else x for x in by]
+        return AFunction.function_wrapper(group_transform, self, AFunction.function_wrapper(grouping, *by), func,
+                                          **kwargs)
+
+    def group_sum(self, by) -> AFunction:
+        """ Sum of the group of every row (see `group_transform`). """
+        return self.group_transform('sum', by)
+
+    def group_mean(self, by) -> AFunction:
+        """ Mean of the group of every row (see `group_transform`). """
+        return self.group_transform('mean', by)
+
+    def group_min(self, by) -> AFunction:
+        """ Minimum of the group of every row (see `group_transform`). """
+        return self.group_transform('min', by)
+
+    def group_max(self, by) -> AFunction:
+        """ Maximum of the group of every row (see `group_transform`). """
+        return self.group_transform('max', by)
+
+    def group_count(self, by) -> AFunction:
+        """ Number of non-missing values in the group of every row (see `group_transform`). """
+        return self.group_transform('count', by)
+
+    def group_size(self, by) -> AFunction:
+        """ Number of rows in the group of every row (see `group_transform`). """
+        return self.group_transform('size', by)
+
+    def group_rank(self, by, **kwargs) -> AFunction:
+        """ Rank within the group (see `group_transform`, `kwargs` are passed to pandas `rank`). """
+        return self.group_transform('rank', by, **kwargs)
 
     def __call__(self, af):
         return self.from_frame(af)
 
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """ Numpy ufuncs build the nodes applied to the arrays underlying the operands, see `ArrayOp`. """
+        if method != '__call__' or ufunc.nout != 1 or 'out' in kwargs:
+            return NotImplemented
+        return AFunction.function_wrapper(array_op(ufunc), *inputs, **kwargs)
+
+    def __array_function__(self, func, types, args, kwargs):
+        """ Numpy functions build the nodes of the equivalent pd.Series methods or the elementwise `ArrayOp`. """
+        method = series_method(func, args, kwargs)
+        if method is not None and isinstance(args[0], AFunction):
+            return getattr(args[0], method[0])(**method[1])
+        if func in ARRAY_FUNCTIONS and not (func is np.where and len(args) + len(kwargs) != 3):
+            return AFunction.function_wrapper(array_op(func), *args, **kwargs)
+        return NotImplemented
+
     def __repr__(self):
         return f"AFunction[{self.func.__name__ if hasattr(self.func, '__name__') else self.func}]"
 
@@ -64,10 +192,72 @@ class AFunction:
             modified_args = [(x.from_frame(af) if isinstance(x, AFunction) else x) for x in args]
             modified_kwargs = {k: (v.from_frame(af) if isinstance(v, AFunction) else v) for k, v in kwargs.items()}
             return func(*modified_args, **modified_kwargs)
-        return AFunction(applied_func)
+        afunc = AFunction(applied_func)
+        afunc.op, afunc.args, afunc.kwargs = func, args, kwargs
+        return afunc
+
+    @property
+    def operands(self) -> List[AFunction]:
+        """ AFunctions (and AColumns) this function is directly calculated from. """
+        if self.op is None:
+            return [self.func] if isinstance(self.func, AFunction) else []
+        return [x for x in itertools.chain(self.args, self.kwargs.values()) if isinstance(x, AFunction)]
+
+    @property
+    def dependencies(self) -> List[AColumn]:
+        """
+        AColumns this function directly depends on (anonymous intermediate functions are looked through).
+        Opaque functions (such as lambdas) do not declare their dependencies.
+        """
+        deps = {}
+        seen = set()
+        stack = list(reversed(self.operands))
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if isinstance(node, AColumn):
+                deps.setdefault(node.name, node)
+            else:
+                stack.extend(reversed(node.operands))
+        return list(deps.values())
+
+    @property
+    def key(self) -> tuple:
+        """
+        Structural key of the function - it is given by the operation and the keys of its operands, so
+        independently built, but identical expressions (such as both `x * y` in `x * y + x * y`) have equal keys
+        and can be calculated only once. Opaque functions are identified by the underlying callable.
+        """
+        return self.definition_key
+
+    @property
+    def definition_key(self) -> tuple:
+        """ Structural key of the definition of the function (differs from `key` for AColumns). """
+        if self._key is None:
+            # keys of operands have to be known first, done without recursion as the expressions can be deep
+            stack = [self]
+            while stack:
+                node = stack[-1]
+                missing = [x for x in node.operands if not isinstance(x, AColumn) and x._key is None]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                stack.pop()
+                node._key = node._make_key()
+        return self._key
+
+    def _make_key(self) -> tuple:
+        if self.op is None:
+            if isinstance(self.func, AFunction):
+                return self.func.key
+            return _StructKey(('func', self.func))
+        return _StructKey((self.op, tuple(_arg_key(x) for x in self.args),
+                           tuple((k, _arg_key(v)) for k, v in sorted(self.kwargs.items()))))
 
     def __hash__(self):
-        return hash(self.func)
+        return hash(self.key)
 
 
 class ANamedFunction(AFunction):
@@ -86,7 +276,7 @@ class ANamedFunction(AFunction):
         return f"ANamedFunction['{self.name}']"
 
     def from_frame(self, af):
-        result = self.func(af)
+        result = super().from_frame(af)
         if isinstance(result, pd.Series):
             return result.rename(self.name)
         else:
@@ -98,10 +288,16 @@ class AColumn(ANamedFunction):
     Just a named function that can be accessed (and constructed on-the-fly if needed) from an AFrame.
     No check is done that the shape conforms the DataFrame (hence can be added). Cached in the frame on the calculation.
     """
-    def __init__(self, name: str, func: Optional[Union[AFunction, Callable, Any]] = None, override: bool = False):
+    def __init__(self, name: str, func: Optional[Union[AFunction, Callable, Any]] = None, override: bool = False,
+                 ephemeral: bool = False, dtype: Optional[Any] = None):
         super().__init__(name=name, func=func)
-        self.override = override  # if True, will override the column with the same name in the AFrame on the first call
-        self.been_applied = False
+        # if True, overrides the column with the same name in the AFrame unless it has been calculated from the same
+        # definition there (so it is not recalculated on every access)
+        self.override = override
+        # if True, the column is not kept in the AFrame when it is calculated only as a dependency of other columns
+        self.ephemeral = ephemeral
+        # dtype the calculated column is stored in (if None, it is given by the calculation or by the frame policy)
+        self.dtype = dtype
 
     def from_frame(self, af):
         res = af[self]
@@ -110,5 +306,10 @@ class AColumn(ANamedFunction):
     def __repr__(self):
         return f"AColumn['{self.name}']"
 
+    @property
+    def key(self) -> tuple:
+        """ AColumns are looked up in the frame by names, so the name is their structural key. """
+        return _StructKey(('AColumn', self.name))
+
     def __hash__(self):
-        return hash(self.name) ^ hash(self.func)
+        return hash(self.key)
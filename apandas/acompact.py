@@ -0,0 +1,47 @@
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+# object columns with at most this share of distinct values (of the non-missing ones) are stored as categories
+CATEGORY_RATIO = 0.5
+
+
+def compact(s: pd.Series) -> pd.Series:
+    """
+    Store the series in the smallest dtype of the same kind that represents all its values exactly: integers
+    in the smallest integer type, floats in float32 if they are not changed by the conversion, booleans stored
+    as objects as bool and the low-cardinality objects as categories. Anything else is returned unchanged.
+    Floats are never converted to integers, as that would change the later arithmetic (such as the division).
+
+    Note that the arithmetic on the downcast integers follows numpy, so it can overflow in the small types.
+    """
+    kind = s.dtype.kind if isinstance(s.dtype, np.dtype) else None
+    if kind == 'f':
+        if s.dtype.itemsize > 4:
+            values = s.to_numpy()
+            with np.errstate(over='ignore'):
+                compacted = values.astype(np.float32)
+            if np.array_equal(compacted.astype(values.dtype), values, equal_nan=True):
+                return pd.Series(compacted, index=s.index, name=s.name)
+        return s
+    if kind is not None and kind in 'iu':
+        return _downcast_integer(s)
+    if kind == 'O' and len(s):
+        inferred = pd.api.types.infer_dtype(s, skipna=False)
+        if inferred == 'boolean':
+            return s.astype(bool)
+        if inferred in ['string', 'mixed'] and pd.api.types.infer_dtype(s, skipna=True) == 'string' \
+                and s.nunique() <= CATEGORY_RATIO * s.count():
+            return s.astype('category')
+    return s
+
+
+def _downcast_integer(s: pd.Series) -> pd.Series:
+    if not len(s):
+        return s
+    low, high = s.min(), s.max()
+    for dtype in [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32, np.int64]:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return s if dtype == s.dtype else s.astype(dtype)
+    return s
@@ -0,0 +1,260 @@
+from __future__ import annotations
+import collections
+from typing import Optional
+import numpy as np
+import pandas as pd
+from .acolumn import AFunction, AColumn
+from .anumpy import ArrayOp
+
+
+# elementwise pd.Series operators that can be fused: numexpr template and numpy function
+_ELEMENTWISE = {
+    getattr(pd.Series, name): (template, func) for name, template, func in [
+        ('__add__', '({} + {})', np.add),
+        ('__sub__', '({} - {})', np.subtract),
+        ('__mul__', '({} * {})', np.multiply),
+        ('__truediv__', '({} / {})', np.true_divide),
+        ('__pow__', '({} ** {})', np.power),
+        ('__and__', '({} & {})', np.bitwise_and),
+        ('__or__', '({} | {})', np.bitwise_or),
+        ('__lt__', '({} < {})', np.less),
+        ('__gt__', '({} > {})', np.greater),
+        ('__le__', '({} <= {})', np.less_equal),
+        ('__ge__', '({} >= {})', np.greater_equal),
+        ('__eq__', '({} == {})', np.equal),
+        ('__ne__', '({} != {})', np.not_equal),
+        ('__abs__', 'abs({})', np.abs),
+    ]
+}
+
+# numexpr templates of the numpy functions of ArrayOps (the others are evaluated by the numpy kernel)
+_NUMEXPR = {
+    np.add: '({} + {})', np.subtract: '({} - {})', np.multiply: '({} * {})', np.true_divide: '({} / {})',
+    np.power: '({} ** {})', np.negative: '(-{})', np.absolute: 'abs({})',
+    np.less: '({} < {})', np.greater: '({} > {})', np.less_equal: '({} <= {})', np.greater_equal: '({} >= {})',
+    np.equal: '({} == {})', np.not_equal: '({} != {})', np.logical_and: '({} & {})', np.logical_or: '({} | {})',
+    np.logical_not: '(~{})', np.where: 'where({}, {}, {})', np.arctan2: 'arctan2({}, {})',
+    **{func: func.__name__ + '({})' for func in [np.sqrt, np.exp, np.expm1, np.log, np.log10, np.log1p, np.sin,
+                                                 np.cos, np.tan, np.arcsin, np.arccos, np.arctan, np.sinh, np.cosh,
+                                                 np.tanh]},
+}
+
+ENGINES = ['numexpr', 'numpy']
+
+
+class BufferArena:
+    """
+    Scratch numpy buffers recycled by the numpy kernel (see `run_fused`) - the buffers of the intermediate results
+    that are not used anymore are given back and taken again for the following results of the same length
+    and dtype, instead of allocating new ones. Only the buffers private to the kernels are ever given back, so the
+    arrays of the frame (including the read-only memory-mapped or loaded ones) are never written.
+    """
+    def __init__(self):
+        # (length, dtype) -> free buffers
+        self.free = {}
+        # buffers taken from the arena by id (kept, so the ids are not reused by other arrays)
+        self.taken = {}
+        self.allocated = 0
+        self.reused = 0
+
+    def take(self, n: int, dtype) -> np.ndarray:
+        """ A buffer for `n` values of `dtype`, recycled if there is a free one. """
+        free = self.free.get((n, np.dtype(dtype)))
+        if free:
+            buffer = free.pop()
+            self.reused += 1
+        else:
+            buffer = np.empty(n, dtype=dtype)
+            self.allocated += 1
+        self.taken[id(buffer)] = buffer
+        return buffer
+
+    def owns(self, array) -> bool:
+        """ Has `array` been taken from the arena? """
+        return self.taken.get(id(array)) is array
+
+    def give(self, array: np.ndarray):
+        """ Give back the buffer that nothing uses anymore. """
+        if isinstance(array, np.ndarray) and array.ndim == 1 and array.flags.writeable and array.flags.c_contiguous:
+            self.free.setdefault((len(array), array.dtype), []).append(array)
+
+
+def resolve_engine(engine: Optional[str]) -> Optional[str]:
+    """ Check the engine name, numexpr falls back to the numpy kernel if it is not installed. """
+    if engine is None:
+        return None
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine {engine!r}, use one of {ENGINES}.')
+    if engine == 'numexpr':
+        try:
+            import numexpr  # noqa: F401
+        except ImportError:
+            return 'numpy'
+    return engine
+
+
+def _kernel(op):
+    """ (numexpr template or None, numpy function) of the elementwise operation, None if it cannot be fused. """
+    if isinstance(op, ArrayOp):
+        return (_NUMEXPR.get(op.func), op.func) if op.elementwise else None
+    return _ELEMENTWISE.get(op)
+
+
+def is_fusable(afunc: AFunction, root: bool = False) -> bool:
+    """ Can be `afunc` evaluated as a part of a fused elementwise expression? """
+    return (root or not isinstance(afunc, AColumn)) and _kernel(afunc.op) is not None and not afunc.kwargs
+
+
+def fused_leaves(afunc: AFunction) -> dict:
+    """ Operands of the maximal fusable subtree rooted in `afunc` (by their keys) that have to be evaluated first. """
+    leaves = {}
+    stack = [afunc]
+    while stack:
+        node = stack.pop()
+        for x in node.operands:
+            if is_fusable(x):
+                stack.append(x)
+            else:
+                leaves.setdefault(x.key, x)
+    return leaves
+
+
+def _subtree(afunc: AFunction) -> list:
+    """ Nodes of the fusable subtree in post-order (operands before the operations). """
+    order, stack = [], [(afunc, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+        else:
+            stack.append((node, True))
+            stack.extend((x, False) for x in node.operands if is_fusable(x))
+    return order
+
+
+def _leaf_arrays(afunc: AFunction, memo: dict):
+    """
+    Underlying numpy arrays of the evaluated leaves (or the numeric scalars, such as the results of reductions).
+    Returns None if the subtree cannot be fused - leaves are not aligned on the same index or are not plain numeric
+    numpy arrays (extension dtypes, objects, datetimes...).
+    """
+    index, constructor = None, None
+    arrays = {}
+    for key in fused_leaves(afunc):
+        value = memo[key]
+        if isinstance(value, (bool, int, float, np.bool_, np.integer, np.floating)):
+            arrays[key] = value
+            continue
+        if not isinstance(value, pd.Series):
+            return None
+        if index is None:
+            index, constructor = value.index, value._constructor
+        elif value.index is not index and not value.index.equals(index):
+            return None
+        if not isinstance(value.dtype, np.dtype) or value.dtype.kind not in 'biuf':
+            return None
+        arrays[key] = value.to_numpy()
+    if index is None:
+        return None
+    for node in _subtree(afunc):
+        for x in node.args:
+            if not isinstance(x, AFunction) and not np.isscalar(x):
+                # pandas would align a series by its index, let pandas handle anything else than scalars
+                return None
+    return index, constructor, arrays
+
+
+def _numpy_kernel(afunc: AFunction, arrays: dict, arena: Optional[BufferArena] = None):
+    """
+    Evaluate the subtree by numpy. With an `arena`, the ufuncs write their results (`out=`) into the buffers of the
+    intermediate results used by no other node or into the recycled buffers of the arena, the released buffers
+    are given back to the arena. The leaves are never written.
+    """
+    nodes = list({id(node): node for node in _subtree(afunc)}.values())
+    operands = {id(node): {id(x) for x in node.args if isinstance(x, AFunction) and x.key not in arrays}
+                for node in nodes}
+    # number of the nodes using every intermediate result, so its buffer can be reused by the last one
+    uses = collections.Counter(i for ids in operands.values() for i in ids)
+    values = {}
+    for node in nodes:
+        func = _kernel(node.op)[1]
+        args = [(arrays[x.key] if x.key in arrays else values[id(x)]) if isinstance(x, AFunction) else x
+                for x in node.args]
+        if arena is None:
+            values[id(node)] = func(*args)
+            continue
+        released = []
+        for i in operands[id(node)]:
+            uses[i] -= 1
+            if uses[i] == 0:
+                released.append(values.pop(i))
+        shape = next((a.shape for a in args if isinstance(a, np.ndarray)), None)
+        if isinstance(func, np.ufunc) and func.nout == 1 and shape is not None:
+            # dtype of the result, given by the operation on the first elements
+            dtype = func(*[a[:1] if isinstance(a, np.ndarray) else a for a in args]).dtype
+            out = next((a for a in released if isinstance(a, np.ndarray) and a.dtype == dtype and a.shape == shape),
+                       None)
+            if out is None:
+                out = arena.take(shape[0], dtype)
+            values[id(node)] = func(*args, out=out)
+            released = [a for a in released if a is not out]
+        else:
+            values[id(node)] = func(*args)
+        for a in released:
+            arena.give(a)
+    return values[id(afunc)]
+
+
+def _numexpr_kernel(afunc: AFunction, arrays: dict):
+    import numexpr
+    local_dict = {}
+    names = {}
+    for key, array in arrays.items():
+        names[key] = f'a{len(names)}'
+        local_dict[names[key]] = array
+    exprs = {}
+    for node in _subtree(afunc):
+        operands = []
+        for x in node.args:
+            if isinstance(x, AFunction):
+                operands.append(names[x.key] if x.key in names else exprs[id(x)])
+            else:
+                operands.append(f'c{len(local_dict)}')
+                local_dict[operands[-1]] = x
+        template = _kernel(node.op)[0]
+        if template is None:
+            raise NotImplementedError(f'{node.op} is not supported by numexpr.')
+        exprs[id(node)] = template.format(*operands)
+    return numexpr.evaluate(exprs[id(afunc)], local_dict=local_dict)
+
+
+def run_fused(afunc: AFunction, memo: dict, engine: str, arena: Optional[BufferArena] = None):
+    """
+    Evaluate the maximal fusable subtree rooted in `afunc` in a single pass over the numpy arrays underlying its
+    (already evaluated) leaves, without allocating pd.Series for the intermediate results. Returns None
+    if the subtree cannot be fused, so it has to be evaluated by pandas. With an `arena`, the numpy kernel
+    evaluates the operations in place (see `BufferArena`). Both engines give the dtypes numpy (and pandas) gives,
+    the numexpr results of another kind are calculated again by numpy.
+    """
+    leaf_arrays = _leaf_arrays(afunc, memo)
+    if leaf_arrays is None:
+        return None
+    index, constructor, arrays = leaf_arrays
+    with np.errstate(all='ignore'):
+        result = None
+        if engine == 'numexpr':
+            try:
+                result = _numexpr_kernel(afunc, arrays)
+            except (TypeError, ValueError, NotImplementedError, KeyError):
+                pass  # operation or dtype not supported by numexpr
+            if result is not None:
+                # numexpr promotes the types on its own, the result has the dtype numpy gives (on the first elements)
+                dtype = _numpy_kernel(afunc, {key: array[:1] if np.ndim(array) else array
+                                              for key, array in arrays.items()}).dtype
+                if result.dtype.kind != dtype.kind:
+                    result = None  # such as the integers calculated as floats
+                elif result.dtype != dtype:
+                    result = result.astype(dtype)
+        if result is None:
+            result = _numpy_kernel(afunc, arrays, arena)
+    return constructor(result, index=index)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+import hashlib
+import os
+import pickle
+import tempfile
+import types
+from typing import Optional
+import numpy as np
+import pandas as pd
+from .acolumn import AFunction, AColumn
+from .anumpy import ArrayOp
+
+
+class _Unstable(Exception):
+    """ The definition contains something that cannot be fingerprinted consistently across processes. """
+
+
+def _value_token(x) -> bytes:
+    """ Stable representation of an operand of the definition (or of a value captured by a function). """
+    if x is None or isinstance(x, (bool, int, float, complex, str, bytes, np.generic)):
+        return f'{type(x).__name__}:{x!r}'.encode()
+    if isinstance(x, (tuple, list)):
+        return f'{type(x).__name__}('.encode() + b','.join(_value_token(v) for v in x) + b')'
+    if isinstance(x, dict):
+        return b'dict(' + b','.join(_value_token(k) + b':' + _value_token(v) for k, v in x.items()) + b')'
+    if isinstance(x, np.ndarray) and x.dtype.kind in 'biufcmM':
+        return f'array:{x.dtype.str}:{x.shape}:'.encode() + hashlib.blake2b(np.ascontiguousarray(x).view(np.uint8),
+                                                                             digest_size=16).digest()
+    if isinstance(x, pd.Series):
+        return b'series:' + fingerprint_series(x).encode()
+    if isinstance(x, (types.FunctionType, types.BuiltinFunctionType, types.MethodDescriptorType,
+                      types.WrapperDescriptorType, np.ufunc, ArrayOp)):
+        return _function_token(x)
+    raise _Unstable(type(x))
+
+
+def _function_token(func) -> bytes:
+    """
+    Functions are identified by their qualified names and the Python ones also by their code, the defaults of
+    their arguments and the values captured by the local ones (such as lambdas), so changing the function
+    invalidates the cached results (the globals it uses are not tracked).
+    """
+    if isinstance(func, ArrayOp):
+        return b'array:' + _function_token(func.func)
+    if isinstance(func, np.ufunc):
+        return f'ufunc:{func.__name__}'.encode()
+    qualname = getattr(func, '__qualname__', '')
+    name = f'{getattr(func, "__module__", None)}.{qualname}'.encode()
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return b'func:' + name
+    closure = [cell.cell_contents for cell in func.__closure__ or ()]
+    return b'func:' + name + b':' + _code_token(code) + _value_token(closure) + _value_token(func.__defaults__) \
+        + _value_token(func.__kwdefaults__)
+
+
+def _code_token(code: types.CodeType) -> bytes:
+    consts = [_code_token(c) if isinstance(c, types.CodeType) else _value_token(c) for c in code.co_consts]
+    return code.co_code + b'|'.join(consts) + repr(code.co_names).encode()
+
+
+def fingerprint_definition(afunc: AFunction) -> Optional[str]:
+    """
+    Fingerprint of the definition of `afunc` that is stable across processes (unlike `AFunction.definition_key`,
+    which contains the objects themselves). The AColumns it depends on are represented only by their names.
+    None if the definition contains something that cannot be fingerprinted (such as an arbitrary object).
+    """
+    fingerprints = {}
+    stack = [afunc]
+    try:
+        while stack:
+            node = stack[-1]
+            operands = [] if isinstance(node, AColumn) and node is not afunc else node.operands
+            missing = [x for x in operands if id(x) not in fingerprints]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            if id(node) in fingerprints:
+                continue
+            h = hashlib.blake2b(digest_size=16)
+            if isinstance(node, AColumn) and node is not afunc:
+                h.update(b'AColumn:' + node.name.encode())
+            elif node.op is None:
+                h.update(fingerprints[id(node.func)] if isinstance(node.func, AFunction)
+                         else _function_token(node.func))
+            else:
+                h.update(_function_token(node.op))
+                operands = [(None, x) for x in node.args] + sorted(node.kwargs.items())
+                for k, x in operands:
+                    h.update(b';' if k is None else f';{k}='.encode())
+                    h.update(fingerprints[id(x)] if isinstance(x, AFunction) else _value_token(x))
+            fingerprints[id(node)] = h.digest()
+    except _Unstable:
+        return None
+    return fingerprints[id(afunc)].hex()
+
+
+def is_opaque(afunc: AFunction) -> bool:
+    """ Does the definition of `afunc` contain an opaque function that can read any columns of the frame? """
+    stack = [afunc]
+    seen = set()
+    while stack:
+        node = stack.pop()
+        if id(node) in seen or (isinstance(node, AColumn) and node is not afunc):
+            continue
+        seen.add(id(node))
+        if node.op is None and not isinstance(node.func, AFunction) and node.func is not None:
+            return True
+        stack.extend(node.operands)
+    return False
+
+
+def fingerprint_series(s: pd.Series) -> str:
+    """ Fingerprint of the content of the series (its values, dtype and index). """
+    h = hashlib.blake2b(digest_size=16)
+    for values in [s.index, s]:
+        h.update(str(values.dtype).encode())
+        if isinstance(values, pd.RangeIndex):
+            h.update(f'range:{values.start}:{values.stop}:{values.step}'.encode())
+            continue
+        array = values.to_numpy()
+        if isinstance(array, np.ndarray) and array.dtype.kind in 'biufcmM':
+            h.update(np.ascontiguousarray(array).view(np.uint8))
+        else:
+            h.update(pd.util.hash_pandas_object(values, index=False).to_numpy())
+    return h.hexdigest()
+
+
+class ADiskCache:
+    """
+    Persistent cache of calculated AColumns in the `directory`, shared by all the AFrames (and processes) using it.
+    The columns are stored under the fingerprints of their definitions and the contents of their inputs, so
+    an AColumn is loaded instead of calculated only if it would be calculated from the same data in the same way.
+
+    The numeric columns are stored as `.npy` files and loaded memory-mapped, the other ones are pickled.
+    The AColumns defined by functions capturing arbitrary objects cannot be fingerprinted and are not cached.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.stores = 0
+
+    def __repr__(self):
+        return f'ADiskCache[{self.directory!r}]'
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key) is not None
+
+    @property
+    def stats(self) -> dict:
+        """ Number of the loaded and of the stored columns. """
+        return {'hits': self.hits, 'stores': self.stores}
+
+    def _path(self, key: str) -> Optional[str]:
+        for ext in ['.npy', '.pkl']:
+            path = os.path.join(self.directory, key + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def load(self, key: str, index: pd.Index, name: str) -> Optional[pd.Series]:
+        """
+        The column stored under `key` (as a series with `index` and `name`), or None if it is not stored.
+        The numeric columns are memory-mapped copy-on-write, so they can be written like the calculated ones,
+        without changing the stored file.
+        """
+        path = self._path(key)
+        if path is None:
+            return None
+        self.hits += 1
+        if path.endswith('.npy'):
+            return pd.Series(np.load(path, mmap_mode='c'), index=index, name=name)
+        with open(path, 'rb') as f:
+            values = pickle.load(f)
+        return pd.Series(values, index=index, name=name)
+
+    def store(self, key: str, value: pd.Series):
+        """ Store the column under `key`, written atomically, so concurrent processes never read partial files. """
+        array = value.to_numpy()
+        numeric = isinstance(value.dtype, np.dtype) and value.dtype.kind in 'biufcmM'
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if numeric:
+                    np.save(f, array)
+                else:
+                    pickle.dump(value.array, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, os.path.join(self.directory, key + ('.npy' if numeric else '.pkl')))
+            self.stores += 1
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def clear(self):
+        """ Remove all the stored columns. """
+        for file in os.listdir(self.directory):
+            if file.endswith('.npy') or file.endswith('.pkl'):
+                os.remove(os.path.join(self.directory, file))
@@ -0,0 +1,92 @@
+from __future__ import annotations
+from typing import Optional, Set
+import pandas as pd
+from .acolumn import AFunction, AColumn
+from .acompile import BufferArena, resolve_engine, is_fusable, fused_leaves, run_fused
+
+
+def evaluate(afunc: AFunction, af, memo: Optional[dict] = None, engine: Optional[str] = None,
+             ops: Optional[dict] = None, arena: Optional[BufferArena] = None):
+    """
+    Evaluate `afunc` on the frame `af` (evaluates the definition if `afunc` is an AColumn).
+
+    The expression tree is traversed without recursion and every structurally distinct subexpression is
+    calculated only once - the values are stored in `memo` under the structural keys, so passing the same `memo`
+    to several calls reuses the common subexpressions of several expressions (within one evaluation pass).
+    AColumns used in the expression are read from `memo` if present, otherwise they are looked up in the frame.
+
+    With `engine` ('numexpr' or 'numpy'), the chains of elementwise arithmetic operations are fused and evaluated
+    in a single pass over the underlying numpy arrays. Anything that cannot be fused is evaluated by pandas.
+
+    `ops` can replace the operations of some nodes (identified by their definition keys) by other callables,
+    for instance by stateful ones when the frame is evaluated by chunks.
+
+    With an `arena`, the fused operations are evaluated in place in the buffers of the intermediate results that
+    are not used anymore and in the recycled buffers of the arena (see `BufferArena`), by the numpy kernel
+    unless `engine` is given.
+    """
+    memo = {} if memo is None else memo
+    engine = resolve_engine(engine or ('numpy' if arena is not None else None))
+    root_key = afunc.definition_key
+    if root_key in memo:
+        return memo[root_key]
+    stack = [(afunc, root_key, False)]
+    while stack:
+        node, key, expanded = stack.pop()
+        root = key is root_key
+        if expanded:
+            result = None
+            if engine is not None and is_fusable(node, root=root):
+                result = run_fused(node, memo, engine, arena)
+                if result is None:
+                    # cannot be fused, so calculate all the intermediate results by pandas
+                    result = evaluate(node, af, memo, ops=ops)
+            memo[key] = _apply(node, af, memo, ops) if result is None else result
+        elif key not in memo:
+            if isinstance(node, AColumn) and not root:
+                memo[key] = _lookup(af, node)
+            else:
+                stack.append((node, key, True))
+                if engine is not None and is_fusable(node, root=root):
+                    operands = fused_leaves(node).values()
+                else:
+                    operands = node.operands
+                stack.extend((x, x.key, False) for x in operands)
+    return memo[root_key]
+
+
+def subexpression_keys(afunc: AFunction) -> Set[tuple]:
+    """ Keys of all the subexpressions of `afunc` (the AColumns it depends on are not looked into). """
+    keys = set()
+    stack = [afunc]
+    while stack:
+        node = stack.pop()
+        key = node.definition_key if node is afunc else node.key
+        if key not in keys:
+            keys.add(key)
+            if node is afunc or not isinstance(node, AColumn):
+                stack.extend(node.operands)
+    return keys
+
+
+def _lookup(af, acol: AColumn):
+    """ Read `acol` from the frame, the AFrame calculates it if needed (and widens the compacted columns). """
+    needs_acolumn = getattr(af, '_needs_acolumn', None)
+    if needs_acolumn is None:
+        return af[acol]
+    if not needs_acolumn(acol):
+        # already present, so the AFrame machinery (and its accounting of the accesses) can be skipped
+        return af._widen(acol.name, pd.DataFrame.__getitem__(af, acol.name))
+    return af._widen(acol.name, af[acol])
+
+
+def _apply(node: AFunction, af, memo: dict, ops: Optional[dict] = None):
+    """ Apply a single node on the already evaluated operands. """
+    if node.op is None:
+        if isinstance(node.func, AFunction):
+            return memo[node.func.key]
+        return node.func(af)
+    args = [(memo[x.key] if isinstance(x, AFunction) else x) for x in node.args]
+    kwargs = {k: (memo[v.key] if isinstance(v, AFunction) else v) for k, v in node.kwargs.items()}
+    op = node.op if ops is None else ops.get(node.definition_key, node.op)
+    return op(*args, **kwargs)
@@ -1,9 +1,110 @@
 from __future__ import annotations
+import concurrent.futures
+import copy
 import functools
-from typing import Callable
+import hashlib
+import itertools
+from typing import Callable, Dict, Iterable, List, Optional, Set, Union
+import numpy as np
 import pandas as pd
-import tree
+from pandas._libs.internals import BlockPlacement
+from pandas.core.internals import BlockManager
+from pandas.core.generic import NDFrame
+from pandas.core.indexing import _AtIndexer, _iAtIndexer, _iLocIndexer, _LocIndexer
 from .acolumn import AFunction, AColumn
+from .aeval import evaluate, subexpression_keys
+from .acompile import BufferArena, resolve_engine
+from .agraph import toposort
+from .aparallel import levels, evaluate_timed, evaluate_parallel, evaluate_partitioned
+from .alazy import LazyAFrame
+from .acache import ACache
+from .ammap import AMmapStore, is_mappable
+from .acompact import compact
+from .adisk import ADiskCache, fingerprint_definition, fingerprint_series, is_opaque
+from .agroup import AGrouping, grouping
+from .aprofile import AColumnEvent, Timing, observing, notify
+
+
+# types of arguments that certainly do not contain any AColumn, so they are skipped by a single set lookup
+_PLAIN_TYPES = frozenset([str, int, float, bool, type(None), slice])
+# the only types that are traversed (or replaced), anything else (such as numpy arrays, Series or Index) is a leaf
+_TRAVERSED = (AColumn, list, tuple, dict)
+
+
+def _replace_acols(x, found: list):
+    """
+    Replace all the AColumns in `x` by their names - `x` can be an AColumn or any structure of lists, tuples
+    (including namedtuples) and dicts (AColumns can be both their keys and values). The replaced AColumns are
+    appended to `found`. Done in a single pass and the (sub)structures without any AColumn are returned as they
+    are, without copying. The large lists of plain values are checked by the set of the types of their items,
+    so they are not traversed in Python.
+    """
+    if type(x) in _PLAIN_TYPES:
+        return x
+    if isinstance(x, AColumn):
+        found.append(x)
+        return x.name
+    if isinstance(x, (list, tuple)):
+        types = set(map(type, x))
+        if types <= _PLAIN_TYPES or not any(issubclass(t, _TRAVERSED) for t in types):
+            return x
+        items = [_replace_acols(v, found) for v in x]
+        if all(new is old for new, old in zip(items, x)):
+            return x
+        if type(x) is list or type(x) is tuple:
+            return type(x)(items)
+        return type(x)(*items) if hasattr(x, '_fields') else type(x)(items)
+    if isinstance(x, dict):
+        if not x:
+            return x
+        items = [(_replace_acols(k, found), _replace_acols(v, found)) for k, v in x.items()]
+        if all(k is old_k and v is old_v for (k, v), (old_k, old_v) in zip(items, x.items())):
+            return x
+        if type(x) is dict:
+            return dict(items)
+        # dict subclasses (such as defaultdict) keep their other attributes
+        mapping = copy.copy(x)
+        mapping.clear()
+        mapping.update(items)
+        return mapping
+    return x
+
+
+# kind of conversion of the method results by their type, filled in lazily on the first occurrence of the type
+_result_kinds = {}
+
+
+def _result_kind(t: type) -> str:
+    kind = _result_kinds.get(t)
+    if kind is None:
+        if issubclass(t, pd.DataFrame) and not issubclass(t, AFrame):
+            kind = 'frame'
+        elif issubclass(t, pd.core.groupby.generic.DataFrameGroupBy) and not issubclass(t, AFrameGroupBy):
+            kind = 'frame_groupby'
+        elif issubclass(t, pd.Series) and not issubclass(t, ASeries):
+            kind = 'series'
+        elif issubclass(t, pd.core.groupby.generic.SeriesGroupBy) and not issubclass(t, ASeriesGroupBy):
+            kind = 'series_groupby'
+        else:
+            kind = ''
+        _result_kinds[t] = kind
+    return kind
+
+
+class _LazyMethod:
+    """
+    Placeholder of a wrapped method on the class - the wrapper is built by `build(*args)` only on the first access
+    and then it replaces the placeholder, so the methods that are never used are never wrapped.
+    """
+    __slots__ = ('owner', 'name', 'build', 'args')
+
+    def __init__(self, owner: type, name: str, build: Callable, *args):
+        self.owner, self.name, self.build, self.args = owner, name, build, args
+
+    def __get__(self, obj, objtype=None):
+        wrapper = self.build(*self.args)
+        setattr(self.owner, self.name, wrapper)
+        return wrapper if obj is None else wrapper.__get__(obj, objtype)
 
 
 class AMeta(type):
@@ -11,6 +112,11 @@ class AMeta(type):
     A metaclass for AFrame (and AFrameGroupBy) that modifies all the methods of the parent class
     so they are compatible with using AColumn arguments instead of strings as column names.
 
+    The wrappers are specialized for every method once, on the first access of the method (see `_LazyMethod`),
+    so creating the classes on the import is cheap. On the call, the arguments are traversed only if an AColumn
+    can be present in them and the results are converted by their type, so plain pandas calls pay only for a few
+    cheap checks.
+
     Admittedly this is a bit hacky, but it does what I need.
     """
 
@@ -23,94 +129,78 @@ class AMeta(type):
             # print(*args, **kwargs)
             return None
 
-        def any_acol_in_tree(t):
-            flags = []
-            def acol_in_tree(t):
-                b = isinstance(t, AColumn) or (isinstance(t, dict) and any(isinstance(k, AColumn) for k in t.keys()))
-                flags.append(b)
-            tree.traverse(acol_in_tree, t)
-            return any(flags)
+        def convert_result(self, result, kind, is_getitem, args, kwargs):
+            if kind == 'frame':
+                # print(f'Converting pd.DataFrame {result} to an AFrame:')
+                return AFrame._wrap(result)
+            elif kind == 'frame_groupby':
+                if isinstance(self, AFrame):
+                    return AFrameGroupBy(self, *args, **kwargs)
+                elif isinstance(self, AFrameGroupBy) and is_getitem:
+                    return AFrameGroupBy(self.obj, keys=self.keys, axis=self.axis, as_index=self.as_index,
+                                         selection=args[0], group_keys=self.group_keys, dropna=self.dropna,
+                                         grouper=self.grouper, exclusions=self.exclusions)
+            elif kind == 'series':
+                return ASeries._wrap(result)
+            elif kind == 'series_groupby':
+                if isinstance(self, ASeries):
+                    return ASeriesGroupBy(self, *args, **kwargs)
+                elif isinstance(self, AFrameGroupBy) and is_getitem:
+                    # Series groupby does not use some properties and have not to be propagated
+                    return ASeriesGroupBy(self.obj[args[0]], selection=args[0], dropna=self.dropna,
+                                          keys=None, grouper=self.grouper)
+            return result
 
         def method_wrapper(method, map_args=True):
+            # everything that depends only on the class and the method is resolved once here, not on every call
+            is_getitem = method.__name__ == '__getitem__'
+            # to support access to AFunction - sort of a hack...
+            # should I also support access for iterables of ANamedFunctions?
+            afunc_getitem = name == 'AFrame' and is_getitem
+            # AColumns are not calculated when they are being set
+            add_acols = method.__name__ != '__setitem__' and name in ['AFrame', 'AFrameGroupBy']
+            # the AFrame has to know about the columns written by the user, to invalidate the derived columns
+            writes_column = name == 'AFrame' and method.__name__ in ['__setitem__', '__delitem__', 'insert']
+            # position and name of the argument with the written column(s)
+            column_arg = (1, 'column') if method.__name__ == 'insert' else (0, 'key')
+            # the AFrame reuses the groupers of the same keys
+            is_groupby = name == 'AFrame' and method.__name__ == 'groupby'
+
+            def map_acols(self, args, kwargs):
+                found = []
+                args = _replace_acols(args, found)
+                kwargs = _replace_acols(kwargs, found)
+                # AColumns to be calculated, all of them are materialized together before the call
+                to_add = [acol for acol in found if acol.func is not None] if add_acols else []
+                if to_add:
+                    (self if name == 'AFrame' else self.obj).add_acolumns(to_add)
+                return args, kwargs
+
             @functools.wraps(method)
             def wrapper(self, *args, **kwargs):
-                # to support access to AFunction - sort of a hack...
-                # should I also support access for iterables of ANamedFunctions?
-                if name == 'AFrame' and method.__name__ == '__getitem__' and not kwargs and len(args) == 1 \
-                        and not isinstance(args[0], AColumn) and isinstance(args[0], AFunction):
+                if afunc_getitem and not kwargs and len(args) == 1 \
+                        and isinstance(args[0], AFunction) and not isinstance(args[0], AColumn):
                     result = args[0](self)
                     if isinstance(result, pd.Series) and result.dtype == 'bool':
                         # for easy filtering -- aligned with pandas ability to filter by lambdas
                         result = self[result]
-
                 else:
                     if map_args:
-                        orig_args = args.__copy__() if hasattr(args, '__copy__') else args
-                        orig_kwargs = kwargs.copy()
-
-                        def map_keys(mapping):
-                            if isinstance(mapping, dict):
-                                keys = list(mapping.keys())
-                                for key in keys:
-                                    if isinstance(key, AColumn):
-                                        if method.__name__ != '__setitem__' and key.func is not None:
-                                            if name == 'AFrame':
-                                                self.add_acolumn(key)
-                                            elif name == 'AFrameGroupBy':
-                                                self.obj.add_acolumn(key)
-                                        mapping[key.name] = mapping.pop(key)
-
-                        def map_leaves(x):
-                            if isinstance(x, AColumn):
-                                if method.__name__ != '__setitem__' and x.func is not None:
-                                    if name == 'AFrame':
-                                        self.add_acolumn(x)
-                                    elif name == 'AFrameGroupBy':
-                                        self.obj.add_acolumn(x)
-                                return x.name
-                            else:
-                                return x
-
-                        any_acol_args = any_acol_in_tree(orig_args)
-                        any_acol_kwargs = any_acol_in_tree(orig_kwargs)
-                        if any_acol_args:
-                            args = tree.traverse(map_keys, args)
-                            args = tree.map_structure(map_leaves, args)
-                            # print(f'Converting ARGS: {orig_args} --> {args}')
-                        if any_acol_kwargs:
-                            kwargs = tree.traverse(map_keys, kwargs, top_down=False)
-                            kwargs = tree.map_structure(map_leaves, kwargs)
-                            # print(f'Converting KWARGS: {orig_kwargs} --> {kwargs}')
+                        args, kwargs = map_acols(self, args, kwargs)
 
                     # if method.__name__ not in ['__len__', '__repr__', 'to_string', '__getattr__']:
                     #     print(f'Calling {method.__name__} on {self.__class__.__name__} with args={tuple(a.__repr__() for a in args)}, kwargs={kwargs}')
                     #     # if self.__class__.__name__ == 'AFrame':
                     #     #     print('Here is the full frame\n', self)
 
-                    result = method(self, *args, **kwargs)
-
-                if isinstance(result, pd.DataFrame) and not isinstance(result, AFrame):
-                    # print(f'Converting pd.DataFrame {result} to an AFrame:')
-                    result = AFrame(result)
-                elif isinstance(result, pd.core.groupby.generic.DataFrameGroupBy) and not isinstance(
-                        result, AFrameGroupBy):
-                    if isinstance(self, AFrame):
-                        result = AFrameGroupBy(self, *args, **kwargs)
-                    elif isinstance(self, AFrameGroupBy) and method.__name__ == '__getitem__':
-                        result = AFrameGroupBy(self.obj, keys=self.keys, axis=self.axis, as_index=self.as_index,
-                                               selection=args[0], group_keys=self.group_keys, dropna=self.dropna,
-                                               grouper=self.grouper, exclusions=self.exclusions)
-                elif isinstance(result, pd.Series) and not isinstance(result, ASeries):
-                    result = ASeries(result)
-                elif isinstance(result, pd.core.groupby.generic.SeriesGroupBy) and not isinstance(
-                        result, ASeriesGroupBy):
-                    if isinstance(self, ASeries):
-                        result = ASeriesGroupBy(self, *args, **kwargs)
-                    elif isinstance(self, AFrameGroupBy) and method.__name__ == '__getitem__':
-                        # Series groupby does not use some properties and have not to be propagated
-                        result = ASeriesGroupBy(self.obj[args[0]], selection=args[0], dropna=self.dropna,
-                                                keys=None, grouper=self.grouper)
+                    result = self._groupby(method, args, kwargs) if is_groupby else method(self, *args, **kwargs)
+                    if writes_column:
+                        self._columns_written(kwargs[column_arg[1]] if column_arg[1] in kwargs
+                                              else args[column_arg[0]])
 
+                kind = _result_kind(type(result))
+                if kind:
+                    result = convert_result(self, result, kind, is_getitem, args, kwargs)
                 return result
             return wrapper
 
@@ -119,11 +209,11 @@ class AMeta(type):
                 # if not attr_name.startswith('_') or (attr_name == '__getitem__' and name == 'AFrameGroupBy'):
                 if not attr_name.startswith('_') or attr_name in ['__getitem__', '__setitem__']:
                     _print(f'Modifying {attr_name} on {name} from {parent_class.__name__}')
-                    setattr(aclass, attr_name, method_wrapper(attr_value))
+                    setattr(aclass, attr_name, _LazyMethod(aclass, attr_name, method_wrapper, attr_value))
                 elif (attr_name.startswith('__') and attr_name.endswith('__')):
                 # else:
                     _print(f'Wrapping the output for {attr_name} on {name} from {parent_class.__name__}')
-                    setattr(aclass, attr_name, method_wrapper(attr_value, map_args=False))
+                    setattr(aclass, attr_name, _LazyMethod(aclass, attr_name, method_wrapper, attr_value, False))
                 else:
                     _print(f'Keeping for {attr_name} on {name} from {parent_class.__name__}')
                     setattr(aclass, attr_name, attr_value)
@@ -142,7 +232,7 @@ class AMeta(type):
                         or attr_name in ['_drop_axis']:
                     _print(f'Wrapping the output for {attr_name} on {name} '
                               f'from {parent_class.__bases__[0].__name__}')
-                    setattr(aclass, attr_name, method_wrapper(attr_value, map_args=False))
+                    setattr(aclass, attr_name, _LazyMethod(aclass, attr_name, method_wrapper, attr_value, False))
                 # else:
                 #     _print(f'Keeping for {attr_name} on {name} from {parent_class.__bases__[0].__name__}')
                 #     setattr(aclass, attr_name, attr_value)
@@ -170,17 +260,26 @@ class ASeries(pd.Series, metaclass=AMeta):
         """ Unwrap to pd.Series. """
         return pd.Series(self)
 
+    @classmethod
+    def _wrap(cls, s: pd.Series) -> ASeries:
+        """ View `s` as an ASeries sharing its block manager (see `AFrame._wrap`). """
+        if isinstance(s, cls):
+            return s
+        result = object.__new__(cls)
+        NDFrame.__init__(result, s._mgr)
+        return NDFrame.__finalize__(result, s)
+
     def __copy__(self, *args, **kwargs):
-        """ Wrap the copied pd.Series as ASeries. """
-        return ASeries(super().__copy__(*args, **kwargs))
+        """ Wrap the copied pd.Series as ASeries (if pandas has not built it as ASeries already). """
+        return ASeries._wrap(super().__copy__(*args, **kwargs))
 
     def __deepcopy__(self, *args, **kwargs):
-        """ Wrap the deepcopied pd.Series as ASeries. """
-        return ASeries(super().__deepcopy__(*args, **kwargs))
+        """ Wrap the deepcopied pd.Series as ASeries (if pandas has not built it as ASeries already). """
+        return ASeries._wrap(super().__deepcopy__(*args, **kwargs))
 
     def copy(self, *args, **kwargs):
-        """ Wrap the copied pd.Series as ASeries. """
-        return ASeries(super().copy(*args, **kwargs))
+        """ Wrap the copied pd.Series as ASeries (if pandas has not built it as ASeries already). """
+        return ASeries._wrap(super().copy(*args, **kwargs))
 
 
 class ASeriesGroupBy(pd.core.groupby.generic.SeriesGroupBy, metaclass=AMeta):
@@ -199,9 +298,118 @@ class AFrame(pd.DataFrame, metaclass=AMeta):
     **kwargs of method calls are converted to strings and the columns are created if they don't exist. In addition,
     if the return is a pd.DataFrame, it is converted to AFrame.
     """
-    def __init__(self, *args, verbose=False, **kwargs):
+    def __init__(self, *args, verbose=False, engine=None, keep_intermediates=True, cache: Optional[ACache] = None,
+                 partitions: Optional[int] = None, disk_cache: Optional[ADiskCache] = None, compact: bool = False,
+                 reuse_buffers: bool = False, **kwargs):
+        resolve_engine(engine)
         super().__init__(*args, **kwargs)
-        self.verbose = verbose
+        self._init_state(verbose=verbose, engine=engine, keep_intermediates=keep_intermediates, cache=cache,
+                         partitions=partitions, disk_cache=disk_cache, compact=compact, reuse_buffers=reuse_buffers)
+
+    # options of the frame (see `__init__`), carried over to its copies and to the results of pandas operations
+    _options = ['verbose', 'engine', 'keep_intermediates', 'cache', 'partitions', 'disk_cache', 'compact',
+                'reuse_buffers']
+
+    def _init_state(self, verbose=False, engine=None, keep_intermediates=True, cache=None, partitions=None,
+                    disk_cache=None, compact=False, reuse_buffers=False):
+        """
+        Set the attributes of the frame (other than the pandas ones). They are written to `__dict__` directly,
+        as the pandas `__setattr__` checks for every attribute whether it is not a column.
+        """
+        self.__dict__.update({
+            'verbose': verbose,
+            # default engine for fusing elementwise operations of AColumns, see `AFunction.compile`
+            'engine': engine,
+            # if False, only the requested AColumns are added to the frame, see `materialize`
+            'keep_intermediates': keep_intermediates,
+            # accounting (and possibly eviction) of the calculated AColumns, see `ACache`
+            'cache': cache,
+            # number of row partitions the AColumns are calculated on in parallel, see `materialize`
+            'partitions': partitions,
+            # number of writes of every column, so the derived columns know which versions they were calculated from
+            '_versions': {},
+            # derived column name -> (definition key, {dependency name: its version at the calculation})
+            '_derivations': {},
+            # derived column name -> the AColumn it has been calculated from (for the columns kept in the frame)
+            '_acolumns': {},
+            # derived columns whose inputs have changed since their calculation
+            '_stale': set(),
+            # grouping keys -> (index, {key name: its version}, grouper), see `_cached_grouping`
+            '_groupings': {},
+            # persistent cache of the calculated AColumns, see `ADiskCache`
+            'disk_cache': disk_cache,
+            # column name -> (its version, index, fingerprint of its content), see `_column_fingerprint`
+            '_fingerprints': {},
+            # memory-mapped files backing the frame and the columns read from them, see `open_mmap`
+            'mmap_store': None,
+            '_mapped': set(),
+            # if True, the calculated AColumns are stored in the smallest dtypes (see `apandas.acompact.compact`),
+            # the AColumns calculated from them read them in their original dtypes (see `_widen`)
+            'compact': compact,
+            # column name -> (its dtype and size in bytes before the compaction), see `memory_report`
+            '_compacted': {},
+            # if True, the intermediate results are calculated in place and their buffers recycled, see `materialize`
+            'reuse_buffers': reuse_buffers,
+            # (index, {column name: its version}, stateful operations, primed operations), see `append_rows`
+            '_append_state': None,
+        })
+
+    def _inherit(self, other: AFrame, tracking: bool = True) -> AFrame:
+        """
+        Take over the options of the AFrame `other` (the cache accounting is copied lazily, see `ACache.copy`, so
+        the frames do not evict each other's columns) and with `tracking` also its tracking of the written and the derived columns, so writing
+        a column of a copy invalidates the columns derived from it in the copy. Returns the frame.
+        """
+        options = {name: getattr(other, name) for name in self._options}
+        if other.cache is not None:
+            options['cache'] = other.cache.copy(self.columns)
+        self.__dict__.update(options)
+        if tracking:
+            columns = set(self.columns)
+            self.__dict__.update({
+                '_versions': dict(other._versions),
+                '_derivations': {k: v for k, v in other._derivations.items() if k in columns},
+                '_acolumns': {k: v for k, v in other._acolumns.items() if k in columns},
+                '_stale': other._stale & columns,
+                '_compacted': {k: v for k, v in other._compacted.items() if k in columns},
+            })
+        return self
+
+    def __finalize__(self, other, method: Optional[str] = None, **kwargs) -> AFrame:
+        """ Pandas calls this on the results of its operations, they inherit the state of the AFrame `other`. """
+        super().__finalize__(other, method=method, **kwargs)
+        if isinstance(other, AFrame) and other is not self:
+            self._inherit(other)
+        return self
+
+    @property
+    def loc(self) -> _ALocIndexer:
+        return _ALocIndexer('loc', self)
+
+    @property
+    def iloc(self) -> _AiLocIndexer:
+        return _AiLocIndexer('iloc', self)
+
+    @property
+    def at(self) -> _AAtIndexer:
+        return _AAtIndexer('at', self)
+
+    @property
+    def iat(self) -> _AiAtIndexer:
+        return _AiAtIndexer('iat', self)
+
+    @classmethod
+    def _wrap(cls, df: pd.DataFrame) -> AFrame:
+        """
+        View `df` as an AFrame sharing its block manager, so nothing is copied or consolidated (unlike `AFrame(df)`,
+        which goes through the whole pandas constructor). AFrames are returned as they are.
+        """
+        if isinstance(df, cls):
+            return df
+        af = object.__new__(cls)
+        NDFrame.__init__(af, df._mgr)
+        af._init_state()
+        return NDFrame.__finalize__(af, df)
 
     @property
     def _constructor(self) -> Callable[..., AFrame]:
@@ -209,29 +417,653 @@ class AFrame(pd.DataFrame, metaclass=AMeta):
 
     _constructor_sliced: Callable[..., ASeries] = ASeries
 
+    # attributes that pandas must not confuse with columns
+    _internal_names = pd.DataFrame._internal_names + ['_versions', '_derivations', '_acolumns', '_stale',
+                                                      '_groupings', '_fingerprints', '_mapped', '_compacted',
+                                                      '_append_state']
+    _internal_names_set = set(_internal_names)
+
     def add_acolumn(self, acol: AColumn):
-        """ Generate `acol AColumn` in the `AFrame`. """
-        if not acol.name in self.columns or (acol.override and not acol.been_applied):
-            if self.verbose:
-                print(f'Adding {acol.__repr__()} to the AFrame.')
-            super().__setitem__(acol.name, acol.func(self))
-            acol.been_applied = True
+        """ Generate `acol AColumn` in the `AFrame` (together with its missing dependencies). """
+        self.materialize([acol])
+
+    def add_acolumns(self, acols: Iterable[AColumn]):
+        """
+        Generate all `acols` in the `AFrame` (together with their missing dependencies) in a single pass, the new
+        columns are inserted into the frame at once. See `materialize` for the options.
+        """
+        self.materialize(acols)
+
+    def materialize(self, acols: Iterable[AColumn], keep_intermediates: Optional[bool] = None,
+                    executor: Optional[Union[str, concurrent.futures.Executor]] = None,
+                    max_workers: Optional[int] = None, partitions: Optional[int] = None):
+        """
+        Generate all `acols` in the `AFrame` together with their missing dependencies. The dependency graph is
+        built upfront and sorted topologically, so every AColumn is calculated exactly once and only after all
+        the AColumns it depends on are already present in the frame. Structurally identical subexpressions
+        are calculated only once as well (even if they are shared by several of the AColumns).
+
+        The intermediate AColumns (the dependencies that are not in `acols`) are added to the frame as well,
+        unless `keep_intermediates` is False (defaults to the frame setting) or they are `ephemeral`. Such
+        intermediates are kept only in a scratch space and released as soon as the last AColumn that
+        depends on them is calculated.
+
+        If the frame has a `cache` with a memory budget, the least valuable calculated AColumns (except `acols`)
+        are dropped from the frame after the calculation to fit into the budget.
+
+        If the frame has a `disk_cache` (see `ADiskCache`), the AColumns stored there under the same definition
+        and the same inputs are loaded instead of calculated and the calculated ones are stored.
+
+        With an `executor` ('thread', 'process' or a `concurrent.futures.Executor`), the independent AColumns
+        are calculated in parallel on `max_workers` workers, see `apandas.aparallel.evaluate_parallel`. The 'process'
+        executor forks the workers, so it is not available on the platforms without the 'fork' start method.
+
+        With `partitions` (defaults to the frame setting), every AColumn is instead calculated on that many row
+        partitions in parallel (on the `executor`, 'thread' by default), if its definition allows for it,
+        see `apandas.aparallel.evaluate_partitioned`.
+
+        If the frame has `reuse_buffers` (and the AColumns are calculated serially), the elementwise operations are
+        evaluated by the numpy kernel (unless an engine is set) in place - in the buffers of the intermediate results
+        no other operation uses. The intermediate results are released as soon as no following AColumn of the pass
+        needs them and their buffers are recycled for the following AColumns of the same length and dtype, see
+        `apandas.acompile.BufferArena`. The columns of the frame are never written.
+        """
+        acols = list(acols)
+        keep_intermediates = self.keep_intermediates if keep_intermediates is None else keep_intermediates
+        outputs = {acol.name for acol in acols}
+        partitions = self.partitions if partitions is None else partitions
+        observed = observing()
+        if self.cache is not None or observed:
+            self._record_hits(acols, observed)
+        order = toposort(acols, prune=lambda acol: not self._needs_acolumn(acol))
+        chains = _chains(acols, order) if observed else {}
+        order, loaded, disk_keys, flush_at = self._lookup(order, outputs, parallel=executor is not None
+                                                          and not partitions)
+        # values of common subexpressions are shared by all the columns calculated in this pass,
+        # the groupings of the keys calculated in the previous passes are reused
+        memo = {key: entry[2] for key, entry in self._groupings.items()
+                if key[0] is grouping and self._grouping_valid(entry)}
+        arena = BufferArena() if self.reuse_buffers and executor is None and not partitions else None
+        release = _buffer_releases(order, start=len(loaded)) if arena is not None else {}
+        results = self._evaluate(order, memo, executor, max_workers, partitions, arena)
+        # position of the last AColumn that depends on each column, so the scratch columns can be released after
+        last_use = {dep.name: i for i, acol in enumerate([acol for acol, _, _ in loaded] + order)
+                    for dep in acol.dependencies}
+        pending, scratch = {}, set()
+        for i, (acol, value, timing) in enumerate(itertools.chain(loaded, results)):
+            stored = acol.name in outputs or (keep_intermediates and not acol.ephemeral)
+            value, read = self._prepare(acol, value, disk_keys.get(acol.name), stored)
+            if stored:
+                nbytes = self._add_calculated(acol, value, timing, disk_keys.get(acol.name), pending, memo, read,
+                                              measure=observed)
+            else:
+                if self.verbose:
+                    print(f'Calculating {acol.__repr__()} in the scratch space.')
+                memo[acol.key] = value
+                scratch.add(acol.name)
+                nbytes = value.memory_usage(index=False) if isinstance(value, pd.Series) else 0
+            if observed:
+                notify(AColumnEvent(acol.name, chains[acol.name], hit=False, timing=timing, nbytes=nbytes))
+            self._record_derivation(acol)
+            for dep in acol.dependencies:
+                if dep.name in scratch and last_use[dep.name] == i:
+                    memo.pop(dep.key, None)
+                    memo.pop(dep.definition_key, None)
+                    scratch.discard(dep.name)
+            for key in release.get(i, []):
+                if isinstance(memo.get(key), pd.Series):
+                    array = memo.pop(key).to_numpy()
+                    if arena.owns(array):
+                        arena.give(array)
+            if i + 1 in flush_at:
+                self._flush(pending)
+        self._flush(pending)
+        self._store_groupings(memo)
+        if self.cache is not None:
+            self._evict(protected=outputs)
+
+    def _record_hits(self, acols: List[AColumn], observed: bool):
+        """ Record the requested AColumns that are already in the frame as hits of the cache and of the observers. """
+        for acol in acols:
+            if not self._needs_acolumn(acol):
+                if self.cache is not None and acol.name in self.cache:
+                    self.cache.hit(acol.name)
+                if observed:
+                    notify(AColumnEvent(acol.name, (acol.name,), hit=True))
+
+    def _lookup(self, order: List[AColumn], outputs: Set[str], parallel: bool):
+        """
+        Find the AColumns of `order` (topologically sorted) stored in the disk cache and order the rest of them
+        by waves of the independent ones, if they are calculated in `parallel`. Returns the AColumns
+        to calculate, the loaded AColumns with their values and timings, their disk cache keys (see
+        `_load_from_disk`) and the positions (in the loaded and then the calculated AColumns) before which
+        the pending columns have to be inserted into the frame.
+        """
+        loaded, disk_keys = [], {}
+        if self.disk_cache is not None:
+            order, loaded, disk_keys = self._load_from_disk(order, outputs)
+        waves = levels(order) if parallel else [[acol] for acol in order]
+        order = [acol for wave in waves for acol in wave]
+        # the new columns are inserted into the frame together (see `_insert_columns`) and until then they are read
+        # from the memo, but the opaque functions read the frame directly, so the columns are inserted before them
+        starts = itertools.accumulate([len(loaded)] + [len(wave) for wave in waves])
+        flush_at = {start for start, wave in zip(starts, waves) if any(is_opaque(acol) for acol in wave)}
+        return order, loaded, disk_keys, flush_at
+
+    def _evaluate(self, order: List[AColumn], memo: dict, executor, max_workers: Optional[int],
+                  partitions: Optional[int], arena: Optional[BufferArena]):
+        """
+        Lazily evaluate the AColumns of `order` (serially, in parallel on the `executor` or by `partitions`, see
+        `materialize`). Yields the AColumns with their values and timings in the same order.
+        """
+        if partitions:
+            return ((acol, *evaluate_partitioned(acol, self, memo, partitions, executor=executor or 'thread',
+                                                 max_workers=max_workers)) for acol in order)
+        elif executor is None:
+            return ((acol, *evaluate_timed(acol, self, memo, arena=arena)) for acol in order)
+        return evaluate_parallel(self, order, memo, executor, max_workers=max_workers)
+
+    def _prepare(self, acol: AColumn, value, disk_key: Optional[str], stored: bool):
+        """
+        Store the calculated `value` of `acol` in the disk cache and, if it is `stored` in the frame, convert it
+        to its final dtype. Returns the converted value and the value read by the following AColumns - the one
+        before the compaction by the frame (see `_widen`).
+        """
+        if disk_key is not None and disk_key not in self.disk_cache and isinstance(value, pd.Series):
+            self.disk_cache.store(disk_key, value)
+        if stored and isinstance(value, pd.Series) and (acol.dtype is not None or self.compact):
+            compacted = self._compact(acol, value)
+            return compacted, compacted if acol.dtype is not None else value
+        return value, value
+
+    def _widen(self, name: str, value):
+        """
+        The column `name` as read by the calculation of other AColumns - in its original dtype if the frame has
+        compacted it, so the compaction does not change the results (by the precision of float32 or by
+        the overflow of the small integers). The explicit `dtype` of an AColumn is kept.
+        """
+        entry = self._compacted.get(name)
+        acol = self._acolumns.get(name)
+        if entry is None or acol is None or acol.dtype is not None or not isinstance(value, pd.Series):
+            return value
+        return value.astype(entry[0])
+
+    def _add_calculated(self, acol: AColumn, value, timing: Timing, disk_key: Optional[str],
+                        pending: Dict[str, pd.Series], memo: dict, read=None, measure: bool = False) -> Optional[int]:
+        """
+        Add the calculated `value` of `acol` to the frame - into the memory-mapped store, to the `pending` columns
+        inserted later together or directly - and record its version. The following AColumns of the pass read
+        it from the `memo` (the value `read`, `value` by default). Returns its size in bytes if the frame has a cache or
+        with `measure`.
+        """
+        if self.verbose:
+            print(f'Adding {acol.__repr__()} to the AFrame.')
+        if self.mmap_store is not None and self._writes_back(acol, value):
+            self._flush(pending)
+            self._insert_mapped(acol.name, self.mmap_store.write(acol.name, value.to_numpy(),
+                                                                 fingerprint_definition(acol), self._inputs(acol)))
+        elif isinstance(value, pd.Series) and _is_memmap(value.to_numpy()) and value.index.equals(self.index):
+            # such as the columns loaded from the disk cache, the consolidation would copy them into memory
+            self._flush(pending)
+            self._insert_array(acol.name, value.to_numpy())
+        elif isinstance(value, pd.Series) and acol.name not in self.columns and acol.name not in pending \
+                and value.index.equals(self.index):
+            pending[acol.name] = value
+        else:
+            self._flush(pending)
+            super().__setitem__(acol.name, value)
+        # the memo can hold the previous value of the column (read by an overriding AColumn of the same name)
+        memo[acol.key] = value if read is None else read
+        self._acolumns[acol.name] = acol
+        self._versions[acol.name] = self._versions.get(acol.name, 0) + 1
+        if disk_key is not None:
+            self._fingerprints[acol.name] = (self._versions[acol.name], self.index, disk_key)
+        nbytes = None
+        if self.cache is not None or measure:
+            nbytes = (value if acol.name in pending else super().__getitem__(acol.name)).memory_usage(index=False)
+        if self.cache is not None:
+            self.cache.add(acol.name, nbytes, timing.wall)
+        return nbytes
+
+    def _record_derivation(self, acol: AColumn):
+        """
+        Record the definition of the calculated `acol` and the versions of its dependencies (even for the scratch
+        columns, so the invalidation passes through them).
+        """
+        self._derivations.pop(acol.name, None)
+        self._derivations[acol.name] = (acol.definition_key,
+                                        {dep.name: self._versions.get(dep.name, 0) for dep in acol.dependencies})
+        self._stale.discard(acol.name)
+
+    def _flush(self, pending: Dict[str, pd.Series]):
+        """ Insert the `pending` columns into the frame (see `_insert_columns`). """
+        self._insert_columns(pending)
+        pending.clear()
+
+    def _store_groupings(self, memo: dict):
+        """ Keep the groupings of the keys calculated in the pass (by source columns only) for the next ones. """
+        for key, value in memo.items():
+            if isinstance(value, AGrouping) and key not in self._groupings and not key[2] \
+                    and all(arg[0] == 'AColumn' for arg in key[1]):
+                self._store_grouping(key, [arg[1] for arg in key[1]], value)
+
+    def _evict(self, protected: Set[str]):
+        """ Drop the columns chosen by the cache to fit into its memory budget, except the `protected` ones. """
+        for name in self.cache.to_evict(protected=protected):
+            if name in self.columns:
+                if self.verbose:
+                    print(f'Evicting {name!r} from the AFrame.')
+                super().__delitem__(name)
+
+    def append_rows(self, batch: pd.DataFrame):
+        """
+        Append the rows of `batch` to the AFrame in place and calculate the derived AColumns of the frame only for
+        the new rows. The `batch` has to contain exactly the source columns of the frame (the ones not calculated
+        from AColumns). `cumsum`, `cumprod` and `diff` continue from the existing rows - their state is kept in the
+        frame, so it is derived from the existing rows only on the first append (or after the frame is modified
+        otherwise). The AColumns that cannot be calculated by parts of the rows (such as grouped AFunctions or
+        opaque functions not declared by `AFunction.rowwise`) and the AColumns derived from them are calculated
+        again over all the rows.
+
+        If both the frame and the batch have a RangeIndex, the numbering of the rows continues, otherwise the index
+        of the batch is kept.
+        """
+        # astream imports AFrame
+        from .astream import is_streamable, prime_stateful_ops, _stateful_ops
+        batch = pd.DataFrame(batch)
+        registered = {name: acol for name, acol in self._acolumns.items() if name in self.columns}
+        sources = [name for name in self.columns if name not in registered]
+        if set(batch.columns) != set(sources):
+            raise ValueError(f'The batch has to contain exactly the source columns {sources}, '
+                             f'got {list(batch.columns)}.')
+        self.materialize([acol for name, acol in registered.items() if name in self._stale])
+        order = toposort(registered.values(), prune=lambda acol: acol.name in sources)
+        recalculated = set()
+        for acol in order:
+            if not is_streamable(acol) or any(dep.name in recalculated for dep in acol.dependencies):
+                recalculated.add(acol.name)
+        incremental = [acol for acol in order if acol.name not in recalculated]
+        # the state of the stateful operations after the last append, unless the frame has been modified since
+        state = self._append_state
+        if state is None or state[0] is not self.index \
+                or any(self._versions.get(name, 0) != v for name, v in state[1].items()):
+            state = (self.index, {}, {}, set())
+        _, _, ops, primed = state
+        ops.update({k: v for k, v in _stateful_ops(incremental).items() if k not in ops})
+        prime_stateful_ops(ops, primed, incremental, self)
+
+        if isinstance(self.index, pd.RangeIndex) and isinstance(batch.index, pd.RangeIndex):
+            step = self.index.step
+            batch = batch.set_axis(pd.RangeIndex(self.index.stop, self.index.stop + len(batch) * step, step))
+        delta = AFrame(batch[sources])
+        memo, values = {}, {}
+        for acol in incremental:
+            value = evaluate(acol, delta, memo, engine=acol.engine or self.engine, ops=ops)
+            if acol.name in registered:
+                values[acol.name], value = self._prepare(acol, value, None, stored=True)
+            memo[acol.key] = value
+        delta._insert_columns(values)
+        self._mgr = pd.concat([pd.DataFrame(self), pd.DataFrame(delta).reindex(columns=self.columns)])._mgr
+        self._clear_item_cache()
+        # the new rows are not memory-mapped, the index has changed, so the cached groupings and fingerprints
+        # are not valid anymore
+        self._mapped = set()
+        if recalculated:
+            self._stale.update(name for name in recalculated if name in registered)
+            self.materialize([acol for acol in order if acol.name in recalculated and acol.name in registered])
+        self._append_state = (self.index, {name: self._versions.get(name, 0) for name in self.columns}, ops, primed)
+
+    @classmethod
+    def open_mmap(cls, path: str, **kwargs) -> AFrame:
+        """
+        Open the AFrame backed by memory-mapped files without copying them into memory, so several processes
+        on the same node share a single physical copy of the columns. The `path` is a directory of .npy files
+        (one per column) or an Arrow IPC / Feather file (with an additional directory `<path>.acolumns`),
+        see `to_mmap`. The `kwargs` are the options of the AFrame, the index is a RangeIndex.
+
+        The calculated AColumns are written back to the store as new mapped files (if they are numeric and
+        they are calculated only from the mapped columns, not from the columns written in this process), so
+        the other processes opening the store later do not have to calculate them. They are written with their
+        definitions and inputs, so they become stale when their inputs are written, as in the frame that calculated
+        them. The mapped columns are read-only, they can be replaced as a whole only.
+        """
+        store = AMmapStore(path)
+        af = cls(store.read(), copy=False, **kwargs)
+        af.mmap_store = store
+        af._mapped = set(af.columns)
+        # the written back columns are still derived from their inputs (and stale once they are written)
+        for name, (definition, inputs) in store.derivations().items():
+            if name in af.columns:
+                af._derivations[name] = (definition, {dep: 0 for dep in inputs})
+        return af
+
+    def to_mmap(self, path: str):
+        """
+        Write the AFrame to be opened by `open_mmap`: to a directory of .npy files (only numeric and datetime
+        columns) or to an uncompressed Arrow IPC / Feather file if the `path` ends with '.feather', '.arrow'
+        or '.ipc' (requires pyarrow). The index is not stored.
+        """
+        AMmapStore(path).create(pd.DataFrame(self))
+
+    def lazy(self) -> LazyAFrame:
+        """
+        Start a lazy query on the AFrame - the steps are recorded into a plan and calculated only on `collect`,
+        so the filters can be applied before the calculation of the derived AColumns. See `LazyAFrame`.
+        """
+        return LazyAFrame(self)
+
+    def version(self, col) -> int:
+        """
+        Number of writes of the column `col` (AColumn or its name) in this AFrame - both by the user and
+        by the calculation of AColumns. Zero if the column has never been written (or was present on the creation).
+        """
+        return self._versions.get(col.name if isinstance(col, AColumn) else col, 0)
+
+    def is_stale(self, acol: AColumn) -> bool:
+        """ Has any (transitive) input of the calculated `acol` been changed since its calculation? """
+        return acol.name in self._stale
+
+    def _needs_acolumn(self, acol: AColumn) -> bool:
+        if acol.name not in self.columns or acol.name in self._stale:
+            return True
+        # override the column unless it has been calculated from the same definition in this frame
+        # (or written back to the memory-mapped store from it, such columns record the fingerprints of definitions)
+        if not acol.override:
+            return False
+        definition = self._derivations.get(acol.name, (None,))[0]
+        if isinstance(definition, str):
+            return definition != fingerprint_definition(acol)
+        return definition != acol.definition_key
+
+    def memory_report(self) -> pd.DataFrame:
+        """
+        Memory of every column (in bytes, including the objects) and the memory saved by storing the calculated
+        AColumns in the smaller dtypes (see the `dtype` of AColumn and the `compact` option of AFrame).
+        """
+        rows = {}
+        for name in self.columns:
+            column = pd.DataFrame.__getitem__(self, name)
+            nbytes = column.memory_usage(index=False, deep=True)
+            original_dtype, original_nbytes = self._compacted.get(name, (str(column.dtype), nbytes))
+            rows[name] = {'dtype': str(column.dtype), 'nbytes': nbytes, 'original_dtype': original_dtype,
+                          'original_nbytes': original_nbytes, 'saved': original_nbytes - nbytes}
+        return pd.DataFrame.from_dict(rows, orient='index',
+                                      columns=['dtype', 'nbytes', 'original_dtype', 'original_nbytes', 'saved'])
+
+    def _compact(self, acol: AColumn, value: pd.Series) -> pd.Series:
+        """ Convert the calculated value to the `dtype` of `acol` or to the smallest dtype if the frame is compact. """
+        compacted = value.astype(acol.dtype) if acol.dtype is not None else compact(value)
+        if compacted.dtype != value.dtype:
+            self._compacted[acol.name] = (str(value.dtype), value.memory_usage(index=False, deep=True))
+        return compacted
+
+    def _inputs(self, acol: AColumn) -> List[str]:
+        """
+        Names of the columns `acol` is calculated from. Opaque functions do not declare their dependencies,
+        so they depend on all the source columns (the derived columns are given by the source ones).
+        """
+        if is_opaque(acol):
+            return [name for name in self.columns if name not in self._derivations]
+        return [dep.name for dep in acol.dependencies]
+
+    def _writes_back(self, acol: AColumn, value) -> bool:
+        """ Can the calculated `acol` be written back to the memory-mapped store? """
+        if not isinstance(value, pd.Series) or not is_mappable(value) or not value.index.equals(self.index):
+            return False
+        return all(name in self._mapped for name in self._inputs(acol))
+
+    def _insert_columns(self, columns: Dict[str, pd.Series]):
+        """
+        Append the new `columns` (aligned with the index) to the frame at once. They are consolidated into a block
+        per dtype and the blocks are added to the block manager of the frame, so adding many columns does not
+        fragment the frame into a block per column (as setting them one by one does). The memory-mapped columns
+        are not passed here, the consolidation would copy them (see `_insert_array`).
+        """
+        if not columns:
+            return
+        if not isinstance(self._mgr, BlockManager):
+            for name, value in columns.items():
+                super().__setitem__(name, value)
+            return
+        new = pd.DataFrame(columns, index=self.index)._mgr
+        offset = len(self.columns)
+        blocks = list(self._mgr.blocks) + [
+            block.make_block_same_class(block.values, placement=BlockPlacement(block.mgr_locs.as_array + offset))
+            for block in new.blocks]
+        self._mgr = BlockManager(blocks, [self.columns.append(new.items), self.index])
+        self._clear_item_cache()
+
+    def _insert_array(self, name: str, array):
+        """ Add the column to the frame without copying the numpy `array` (the assignment would copy it). """
+        if name in self.columns:
+            super().__delitem__(name)
+        self._mgr.insert(len(self.columns), name, array)
+        self._clear_item_cache()
+
+    def _insert_mapped(self, name: str, array):
+        """ Add the column memory-mapped from the store to the frame without copying it. """
+        self._insert_array(name, array)
+        self._mapped.add(name)
+
+    def _load_from_disk(self, order: List[AColumn], outputs: Set[str]):
+        """
+        Split the topologically sorted AColumns to be calculated into the ones stored in the disk cache and
+        the ones that still have to be calculated. Returns the AColumns to calculate, the loaded AColumns
+        with their values and timings, and the disk cache keys of all the AColumns (None if they cannot be cached).
+        The stored AColumns needed only for the calculation of other stored AColumns are not even loaded.
+        """
+        keys = {}
+        for acol in order:
+            definition = fingerprint_definition(acol)
+            inputs = [(name, keys[name] if name in keys else self._column_fingerprint(name))
+                      for name in self._inputs(acol)]
+            if definition is None or any(fp is None for _, fp in inputs):
+                keys[acol.name] = None
+            else:
+                # so the key of a derived column covers the whole chain of the calculations from the source columns
+                h = hashlib.blake2b(f'{acol.name}:{definition}:{acol.dtype}:{self.compact}'.encode(), digest_size=16)
+                for name, fp in sorted(inputs):
+                    h.update(f';{name}={fp}'.encode())
+                keys[acol.name] = h.hexdigest()
+        stored = {acol.name for acol in order if keys[acol.name] is not None and keys[acol.name] in self.disk_cache}
+        needed = set(outputs)
+        for acol in reversed(order):
+            if acol.name in needed and acol.name not in stored:
+                needed.update(dep.name for dep in acol.dependencies)
+        loaded = []
+        for acol in order:
+            if acol.name not in needed:
+                # not calculated, but the invalidation has to pass through it
+                self._derivations.pop(acol.name, None)
+                self._derivations[acol.name] = (acol.definition_key, {dep.name: self._versions.get(dep.name, 0)
+                                                                      for dep in acol.dependencies})
+            elif acol.name in stored:
+                with Timing() as timing:
+                    value = self.disk_cache.load(keys[acol.name], self.index, acol.name)
+                loaded.append((acol, value, timing))
+        return [acol for acol in order if acol.name in needed and acol.name not in stored], loaded, keys
+
+    def _column_fingerprint(self, name: str) -> Optional[str]:
+        """
+        Fingerprint of the content of the column, either the disk cache key it has been calculated (or loaded)
+        under or the hash of its values, remembered until the column or the index is written.
+        """
+        version = self._versions.get(name, 0)
+        entry = self._fingerprints.get(name)
+        if entry is not None and entry[0] == version and entry[1] is self.index:
+            return entry[2]
+        if name not in self.columns:
+            return None
+        fp = fingerprint_series(pd.DataFrame.__getitem__(self, name))
+        self._fingerprints[name] = (version, self.index, fp)
+        return fp
+
+    def _groupby(self, method, args, kwargs):
+        """
+        Group by the columns `by` (the first argument of `groupby`), reusing the grouper (the group codes and
+        the sort indexers) from the previous groupby by the same keys with the same options, if neither the keys
+        nor the index have been changed since. Anything else than grouping by names of columns is left to the pandas
+        `groupby` (the `method`), including the validation of the arguments.
+        """
+        by = args[0] if args else kwargs.get('by')
+        names = [by] if isinstance(by, str) else by
+        if len(args) > 1 or not isinstance(names, list) or not names \
+                or not all(isinstance(n, str) and n in self.columns for n in names) \
+                or kwargs.get('level') is not None or kwargs.get('axis', 0) not in [0, 'index']:
+            return method(self, *args, **kwargs)
+        key = ('grouper', tuple(names), kwargs.get('sort', True), kwargs.get('observed', False),
+               kwargs.get('dropna', True))
+        cached = self._cached_grouping(key)
+        if cached is None:
+            grouped = method(self, *args, **kwargs)
+            cached = (grouped.grouper, grouped.exclusions)
+            self._store_grouping(key, names, cached)
+        grouper, exclusions = cached
+        return AFrameGroupBy(self, *args, grouper=grouper, exclusions=exclusions, **kwargs)
+
+    def _cached_grouping(self, key):
+        """
+        The cached grouper under `key` if it is still valid. The groupers are invalidated when the index or any of
+        the key columns is written, also via `.loc`, `.iloc`, `.at` or `.iat` (in-place modifications by the pandas
+        methods, such as `fillna(inplace=True)`, are not tracked).
+        """
+        entry = self._groupings.get(key)
+        return entry[2] if entry is not None and self._grouping_valid(entry) else None
+
+    def _grouping_valid(self, entry) -> bool:
+        index, versions, _ = entry
+        return index is self.index and all(self._versions.get(n, 0) == v for n, v in versions.items())
+
+    def _store_grouping(self, key, names, grouper):
+        for k in [k for k, entry in self._groupings.items() if not self._grouping_valid(entry)]:
+            del self._groupings[k]
+        self._groupings[key] = (self.index, {n: self._versions.get(n, 0) for n in names}, grouper)
+
+    def _columns_written(self, key):
+        """
+        Record that the user has written the columns `key` (a name, a list of names, or anything else, such as
+        a boolean mask, that can affect all the columns), via `[]`, `insert`, `del`, `.loc`, `.iloc`, `.at` or `.iat`.
+        The columns derived from them become stale and are recalculated lazily on the next access by AColumn.
+        In-place modifications by the pandas methods, such as `fillna(inplace=True)`, are not tracked.
+        """
+        if isinstance(key, str):
+            names = [key]
+        elif isinstance(key, (list, tuple, pd.Index)) and all(isinstance(k, str) for k in key):
+            names = list(key)
+        else:
+            names = list(self.columns)
+        dependents = {}
+        for name, (_, deps) in self._derivations.items():
+            for dep in deps:
+                dependents.setdefault(dep, []).append(name)
+        stack = []
+        for name in names:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self._mapped.discard(name)
+            self._compacted.pop(name, None)
+            # the column written by the user is not derived anymore
+            self._derivations.pop(name, None)
+            self._acolumns.pop(name, None)
+            self._stale.discard(name)
+            if self.cache is not None:
+                self.cache.discard(name)
+            stack.extend(dependents.get(name, []))
+        while stack:
+            name = stack.pop()
+            if name in self._derivations and name not in self._stale:
+                self._stale.add(name)
+                stack.extend(dependents.get(name, []))
 
     def to_pandas(self):
         """ Unwrap to pd.DataFrame. """
         return pd.DataFrame(self)
 
     def __copy__(self, *args, **kwargs):
-        """ Wrap the copied pd.DataFrame as AFrame. """
-        return AFrame(super().__copy__(*args, **kwargs))
+        """ Wrap the copied pd.DataFrame as AFrame with the state of this one (see `_inherit`). """
+        return AFrame._wrap(super().__copy__(*args, **kwargs))._inherit(self)
 
     def __deepcopy__(self, *args, **kwargs):
-        """ Wrap the deepcopied pd.DataFrame as AFrame. """
-        return AFrame(super().__deepcopy__(*args, **kwargs))
+        """ Wrap the deepcopied pd.DataFrame as AFrame with the state of this one (see `_inherit`). """
+        return AFrame._wrap(super().__deepcopy__(*args, **kwargs))._inherit(self)
 
     def copy(self, *args, **kwargs):
-        """ Wrap the copied pd.DataFrame as AFrame. """
-        return AFrame(super().copy(*args, **kwargs))
+        """ Wrap the copied pd.DataFrame as AFrame with the state of this one (see `_inherit`). """
+        return AFrame._wrap(super().copy(*args, **kwargs))._inherit(self)
+
+
+def _is_memmap(array) -> bool:
+    """ Is the numpy `array` (a view of) a memory-mapped file? """
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def _chains(acols: List[AColumn], order: List[AColumn]) -> Dict[str, tuple]:
+    """ Why is every AColumn of `order` calculated - the chain of the AColumns from the requested one. """
+    chains = {acol.name: (acol.name,) for acol in acols}
+    for acol in reversed(order):
+        for dep in acol.dependencies:
+            chains.setdefault(dep.name, chains[acol.name] + (dep.name,))
+    return chains
+
+
+def _buffer_releases(order: List[AColumn], start: int) -> Dict[int, list]:
+    """
+    Keys of the intermediate results to release after every AColumn of `order` (numbered from `start`) - after
+    the last AColumn that needs them. The values of the AColumns themselves are kept (they are stored in the frame).
+    """
+    roots = {acol.definition_key for acol in order}
+    last_needed = {key: i for i, acol in enumerate(order, start=start)
+                   for key in subexpression_keys(acol) if key not in roots and key[0] != 'AColumn'}
+    release = {}
+    for key, i in last_needed.items():
+        release.setdefault(i, []).append(key)
+    return release
+
+
+def _indexed_columns(af: AFrame, key, positional: bool) -> Optional[List[str]]:
+    """ Names of the columns written through an indexer (`positional` for iloc and iat), None for all of them. """
+    if not isinstance(key, tuple) or len(key) != 2:
+        return None
+    cols = key[1]
+    if positional:
+        if pd.api.types.is_integer(cols):
+            return [af.columns[cols]]
+        if isinstance(cols, list) and all(pd.api.types.is_integer(c) for c in cols):
+            return list(af.columns[cols])
+        return None
+    cols = [cols] if isinstance(cols, str) else cols
+    return cols if isinstance(cols, list) and all(isinstance(c, str) for c in cols) else None
+
+
+class _ALocIndexer(_LocIndexer):
+    """ `loc` of an AFrame, it records the written columns (see `AFrame._columns_written`). """
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.obj._columns_written(_indexed_columns(self.obj, key, positional=False))
+
+
+class _AiLocIndexer(_iLocIndexer):
+    """ `iloc` of an AFrame, it records the written columns (see `AFrame._columns_written`). """
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.obj._columns_written(_indexed_columns(self.obj, key, positional=True))
+
+
+class _AAtIndexer(_AtIndexer):
+    """ `at` of an AFrame, it records the written column (see `AFrame._columns_written`). """
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.obj._columns_written(_indexed_columns(self.obj, key, positional=False))
+
+
+class _AiAtIndexer(_iAtIndexer):
+    """ `iat` of an AFrame, it records the written column (see `AFrame._columns_written`). """
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.obj._columns_written(_indexed_columns(self.obj, key, positional=True))
 
 
 class AFrameGroupBy(pd.core.groupby.generic.DataFrameGroupBy, metaclass=AMeta):
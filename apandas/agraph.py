@@ -0,0 +1,40 @@
+from __future__ import annotations
+from typing import Callable, Iterable, List, Optional
+from .acolumn import AColumn
+
+
+def toposort(acols: Iterable[AColumn], prune: Optional[Callable[[AColumn], bool]] = None) -> List[AColumn]:
+    """
+    Sort `acols` together with all their (transitive) AColumn dependencies topologically, so every AColumn
+    comes after everything it depends on. AColumns are identified by their names, so every column is listed once.
+
+    AColumns for which `prune(acol)` is True are left out together with the part of the graph that is reachable
+    only through them (typically the columns that are already present in the frame). AColumns without
+    a definition (source columns) are never listed.
+
+    The graph is traversed without recursion, so even very deep graphs do not hit the recursion limit.
+    """
+    order = []
+    visiting, done = set(), set()
+    stack = [(acol, False) for acol in reversed(list(acols))]
+    while stack:
+        acol, expanded = stack.pop()
+        if expanded:
+            visiting.discard(acol.name)
+            done.add(acol.name)
+            order.append(acol)
+            continue
+        if acol.func is None:
+            # the column present in the frame, even if an overriding AColumn of the same name refers to it
+            continue
+        if acol.name in done:
+            continue
+        if acol.name in visiting:
+            raise ValueError(f'Cyclic dependency of {acol.__repr__()}.')
+        if prune is not None and prune(acol):
+            done.add(acol.name)
+            continue
+        visiting.add(acol.name)
+        stack.append((acol, True))
+        stack.extend((dep, False) for dep in reversed(acol.dependencies))
+    return order
@@ -0,0 +1,141 @@
+from __future__ import annotations
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+
+# transformations calculated directly from the group codes, anything else is delegated to pandas groupby
+KERNELS = ['sum', 'mean', 'min', 'max', 'count', 'size']
+
+
+class AGrouping:
+    """
+    Rows of a frame factorized into groups by the values of `keys` (pd.Series). Keys with missing values do not
+    belong to any group (their code is -1), as in pandas groupby. The rows sorted by the groups are calculated
+    lazily and shared by all the transformations using the grouping.
+    """
+    def __init__(self, keys: List[pd.Series]):
+        codes, ngroups = None, 1
+        for key in keys:
+            key_codes, uniques = pd.factorize(key)
+            if codes is None:
+                codes, ngroups = key_codes, len(uniques)
+            else:
+                combined = np.where((codes < 0) | (key_codes < 0), -1, codes * len(uniques) + key_codes)
+                codes, ngroups = _factorize_codes(combined)
+        self.index = keys[0].index
+        self.codes = codes
+        self.ngroups = ngroups
+        self.missing = codes < 0
+        self.any_missing = bool(self.missing.any())
+        self._sorted = None
+        self._sizes = None
+
+    def __repr__(self):
+        return f'AGrouping[{self.ngroups} groups]'
+
+    @property
+    def sorted(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Positions of the rows (belonging to some group) sorted by the groups and the starts of the groups. """
+        if self._sorted is None:
+            order = _stable_order(self.codes, self.ngroups)
+            order = order[np.count_nonzero(self.missing):]
+            starts = np.flatnonzero(np.diff(self.codes[order], prepend=-1))
+            self._sorted = order, starts
+        return self._sorted
+
+    def counts(self, values: np.ndarray = None) -> np.ndarray:
+        """ Sizes of the groups, or the numbers of non-missing `values` in the groups. """
+        notna = None if values is None or values.dtype.kind in 'biu' else ~pd.isna(values)
+        if notna is None or notna.all():
+            if self._sizes is None:
+                self._sizes = np.bincount(self._valid(self.codes), minlength=self.ngroups)
+            return self._sizes
+        return np.bincount(self._valid(self.codes), weights=self._valid(notna), minlength=self.ngroups)
+
+    def _valid(self, array: np.ndarray) -> np.ndarray:
+        """ Only the rows belonging to some group. """
+        return array[~self.missing] if self.any_missing else array
+
+    def reduce(self, values: np.ndarray, func: str) -> np.ndarray:
+        """ Aggregate the numeric `values` by the groups, the missing values are skipped. """
+        values = values.astype(np.int64) if values.dtype.kind == 'b' else values
+        floating = values.dtype.kind == 'f'
+        if func in ['sum', 'mean']:
+            if floating:
+                # floats are summed without sorting, integers exactly on the rows sorted by the groups
+                nan = np.isnan(values)
+                weights = np.where(nan, 0, values) if nan.any() else values
+                result = np.bincount(self._valid(self.codes), weights=self._valid(weights), minlength=self.ngroups)
+            else:
+                # summed in 64 bits, as by pandas, so the sums of small integer types do not overflow
+                result = self._reduceat(np.add, values.astype(np.uint64 if values.dtype.kind == 'u' else np.int64))
+            if func == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = result / self.counts(values)
+            return result
+        if func == 'min':
+            return self._reduceat(np.fmin if floating else np.minimum, values)
+        if func == 'max':
+            return self._reduceat(np.fmax if floating else np.maximum, values)
+        raise ValueError(f'Unknown reduction {func!r}.')
+
+    def _reduceat(self, ufunc: np.ufunc, values: np.ndarray) -> np.ndarray:
+        order, starts = self.sorted
+        if not len(order):
+            return np.empty(0, dtype=values.dtype)
+        return ufunc.reduceat(values[order], starts)
+
+    def broadcast(self, per_group: np.ndarray) -> np.ndarray:
+        """ Values of the groups broadcast back to the rows (missing for the rows without a group). """
+        result = per_group[self.codes]
+        if self.any_missing:
+            result = result.astype(np.float64) if result.dtype.kind in 'biu' else result.copy()
+            result[self.missing] = np.nan
+        return result
+
+
+def _stable_order(codes: np.ndarray, ngroups: int) -> np.ndarray:
+    """
+    Stable argsort of the group codes (the missing ones first). numpy sorts 16-bit integers by a radix sort
+    in linear time, so the codes are sorted by their lower and then by their upper 16 bits.
+    """
+    shifted = codes + 1
+    if ngroups < 2 ** 16:
+        return np.argsort(shifted.astype(np.uint16), kind='stable')
+    order = np.argsort((shifted & 0xFFFF).astype(np.uint16), kind='stable')
+    return order[np.argsort((shifted[order] >> 16).astype(np.uint16), kind='stable')]
+
+
+def _factorize_codes(codes: np.ndarray) -> Tuple[np.ndarray, int]:
+    """ Renumber the combined codes of several keys to 0, ..., ngroups - 1 (keeping -1 for the missing ones). """
+    valid = codes >= 0
+    uniques, inverse = np.unique(codes[valid], return_inverse=True)
+    result = np.full(len(codes), -1, dtype=np.intp)
+    result[valid] = inverse
+    return result, len(uniques)
+
+
+def grouping(*keys: pd.Series) -> AGrouping:
+    return AGrouping(list(keys))
+
+
+def group_transform(series: pd.Series, by: AGrouping, func: str, **kwargs) -> pd.Series:
+    """
+    Transformation of `series` within the groups `by` (the result has the same index as `series`). The sums,
+    means, minimums, maximums and counts are calculated directly from the group codes, anything else
+    (such as 'rank', 'cumsum' or 'std') by pandas groupby on the codes.
+    """
+    values = series.to_numpy()
+    if func in KERNELS and not kwargs and isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf' \
+            and not (series.dtype.kind == 'b' and func in ['min', 'max']):
+        if func == 'size':
+            per_group = by.counts()
+        elif func == 'count':
+            per_group = by.counts(values).astype(np.int64)
+        else:
+            per_group = by.reduce(values, func)
+        return pd.Series(by.broadcast(per_group), index=series.index, name=series.name)
+    codes = np.where(by.missing, np.nan, by.codes) if by.any_missing else by.codes
+    grouped = series.groupby(codes, sort=False)
+    return getattr(grouped, func)(**kwargs) if func in ['rank', 'cumsum', 'cumprod', 'cumcount', 'shift', 'diff'] \
+        else grouped.transform(func, **kwargs)
@@ -0,0 +1,171 @@
+from __future__ import annotations
+from typing import List, Optional, Union, TYPE_CHECKING
+import numpy as np
+import pandas as pd
+from .acolumn import AFunction, AColumn
+from .anumpy import array_op, ARRAY_FUNCTIONS
+
+if TYPE_CHECKING:
+    from .aframe import AFrame
+
+
+# operations that calculate every row only from the same row, so the rows can be filtered out before the calculation
+# (including the numpy ufuncs and the elementwise numpy functions)
+ROW_LOCAL = {getattr(pd.Series, name) for name in [
+    '__add__', '__sub__', '__mul__', '__truediv__', '__floordiv__', '__mod__', '__pow__',
+    '__and__', '__or__', '__lt__', '__gt__', '__le__', '__ge__', '__eq__', '__ne__', '__abs__',
+    'round', 'fillna', 'replace',
+]} | {array_op(func) for func in vars(np).values() if isinstance(func, np.ufunc) and func.nout == 1} \
+    | {array_op(func) for func in ARRAY_FUNCTIONS}
+
+
+def is_row_local_node(node: AFunction, scans=()) -> bool:
+    """
+    Does the single `node` (not looking into its operands) calculate every row only from the same row, or is it one
+    of the `scans` (operations over the preceding rows, see `apandas.ascan.SCANS`)? Opaque functions (lambdas,
+    content) are row-local only if declared by `AFunction.rowwise`, operations with non-scalar operands are not
+    (they are aligned by the index or by the position).
+    """
+    if node.op is None:
+        return isinstance(node.func, AFunction) or node.row_local
+    if node.op not in ROW_LOCAL and node.op not in scans:
+        return False
+    if node.op is pd.Series.fillna and (len(node.args) > 2 or node.kwargs.get('method') is not None):
+        return False
+    return all(isinstance(x, AFunction) or x is None or np.isscalar(x)
+               for x in list(node.args) + list(node.kwargs.values()))
+
+
+def is_row_local(afunc: AFunction, af: AFrame) -> bool:
+    """
+    Can be `afunc` calculated on a subset of rows of `af` (with the same result for these rows)? AColumns already
+    present in `af` are taken as they are, opaque functions (lambdas, content) unless declared by
+    `AFunction.rowwise` and operations over several rows (such as `cumsum` or `diff`) are not row-local, as are
+    operations with non-scalar operands, see `is_row_local_node`.
+    """
+    stack = [afunc]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, AColumn) and (node.func is None or node.name in af.columns):
+            continue
+        if not is_row_local_node(node):
+            return False
+        stack.extend(node.operands)
+    return True
+
+
+class LazyAFrame:
+    """
+    Deferred computation on an AFrame. The steps (new AColumns, filters, projections and aggregations) are only
+    recorded into a plan and nothing is calculated until `collect` is called. Then the filters are applied before
+    the calculation of the derived AColumns whenever it does not change the result (the AColumns are row-local),
+    and only the AColumns needed for the final result are calculated.
+
+    Every step returns a new LazyAFrame, the original AFrame is never modified.
+    """
+    def __init__(self, af: AFrame, steps: Optional[list] = None):
+        self.af = af
+        self.steps = steps or []
+
+    def _with_step(self, *step) -> LazyAFrame:
+        return LazyAFrame(self.af, self.steps + [step])
+
+    def with_columns(self, *acols: AColumn) -> LazyAFrame:
+        """ Add `acols` to the result. """
+        return self._with_step('with_columns', list(acols))
+
+    def filter(self, predicate: AFunction) -> LazyAFrame:
+        """ Keep only the rows where the boolean `predicate` is True. """
+        return self._with_step('filter', predicate)
+
+    def select(self, *cols: Union[AColumn, str]) -> LazyAFrame:
+        """ Keep only `cols` (AColumns are calculated if needed). """
+        return self._with_step('select', list(cols))
+
+    def groupby(self, by, **kwargs) -> LazyAFrameGroupBy:
+        """ Group by `by`, the aggregation follows by `agg` on the returned object. """
+        return LazyAFrameGroupBy(self, by, kwargs)
+
+    def __repr__(self):
+        steps = ''.join(f'\n  {step[0]}: {", ".join(repr(x) for x in step[1:])}' for step in self.steps)
+        return f'LazyAFrame[{len(self.steps)} steps]{steps}'
+
+    def collect(self) -> AFrame:
+        """ Execute the plan and return the resulting AFrame. """
+        af = self.af.copy(deep=False)
+        segment = []
+        for step in self.steps:
+            if step[0] == 'agg':
+                _, by, selection, groupby_kwargs, args, kwargs = step
+                needed = [by] if isinstance(by, (str, AColumn)) else list(by)
+                af = _run_segment(af, segment, needed + selection if selection else None)
+                grouped = af.groupby(by, **groupby_kwargs)
+                # the aggregates are new columns, only the options are kept
+                af = type(af)._wrap((grouped[selection] if selection else grouped).agg(*args, **kwargs))._inherit(
+                    af, tracking=False)
+                segment = []
+            else:
+                segment.append(step)
+        return _run_segment(af, segment)
+
+
+class LazyAFrameGroupBy:
+    """ Grouped LazyAFrame, the aggregation is recorded into the plan as well. """
+    def __init__(self, lazy_af: LazyAFrame, by, kwargs: dict, selection: Optional[list] = None):
+        self.lazy_af = lazy_af
+        self.by = by
+        self.kwargs = kwargs
+        self.selection = selection
+
+    def __getitem__(self, cols) -> LazyAFrameGroupBy:
+        """ Aggregate only `cols`. """
+        return LazyAFrameGroupBy(self.lazy_af, self.by, self.kwargs, list(cols))
+
+    def agg(self, *args, **kwargs) -> LazyAFrame:
+        """ Aggregate the groups, the arguments are the same as for `pd.DataFrameGroupBy.agg`. """
+        return self.lazy_af._with_step('agg', self.by, self.selection, self.kwargs, args, kwargs)
+
+    aggregate = agg
+
+
+def _run_segment(af: AFrame, steps: list, needed: Optional[List[Union[AColumn, str]]] = None) -> AFrame:
+    """
+    Execute the `steps` (without aggregations) on `af`. If only some columns are `needed` afterwards, the other
+    columns are not calculated and are dropped.
+    """
+    pending = {}  # requested AColumns that have not been calculated yet
+    selection = None
+    for step in steps:
+        if step[0] == 'with_columns':
+            pending.update((acol.name, acol) for acol in step[1])
+            if selection is not None:
+                selection.extend(step[1])
+        elif step[0] == 'select':
+            selection = list(step[1])
+            pending.update((x.name, x) for x in selection if isinstance(x, AColumn))
+        elif step[0] == 'filter':
+            # the columns requested before the filter that are not row-local have to be calculated on all rows
+            early = [acol for acol in pending.values() if not is_row_local(acol, af)]
+            if early:
+                af.materialize(early)
+                for acol in early:
+                    pending.pop(acol.name)
+            predicate = step[1]
+            mask = af[predicate] if isinstance(predicate, AColumn) else predicate(af)
+            af = type(af)._wrap(af.take(np.flatnonzero(mask.to_numpy(dtype=bool))))._inherit(af)
+    if needed is not None:
+        if selection is None:
+            selection = needed
+        else:
+            names = {_name(x) for x in selection}
+            selection = selection + [x for x in needed if _name(x) not in names]
+    if selection is None:
+        af.materialize(pending.values())
+        return af
+    # the intermediates would be dropped by the projection anyway
+    af.materialize((x for x in selection if isinstance(x, AColumn)), keep_intermediates=False)
+    return af[[_name(x) for x in selection]]
+
+
+def _name(col: Union[AColumn, str]) -> str:
+    return col.name if isinstance(col, AColumn) else col
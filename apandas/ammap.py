@@ -0,0 +1,127 @@
+from __future__ import annotations
+import json
+import os
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+import numpy as np
+import pandas as pd
+
+# suffixes of the Arrow IPC (Feather) files, any other path is a directory of .npy files
+ARROW_SUFFIXES = ['.feather', '.arrow', '.ipc']
+# order of the base columns in the directory of .npy files
+_MANIFEST = '_columns.json'
+# the definitions and the inputs of the calculated columns written back to the store
+_DERIVED = '_derived.json'
+
+
+def is_mappable(values) -> bool:
+    """ Can the values (np.ndarray or pd.Series) be stored in a .npy file and memory-mapped? """
+    return isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufcmM'
+
+
+class AMmapStore:
+    """
+    Columns of a frame in memory-mapped files, so several processes on the same node share a single physical copy
+    of them (through the page cache of the operating system). The `path` is either a directory of .npy files
+    (one per column) or an Arrow IPC / Feather file (uncompressed, otherwise the columns are decompressed into
+    memory) with a directory `<path>.acolumns` for the columns added later. The mapped columns are read-only.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.arrow = any(path.endswith(suffix) for suffix in ARROW_SUFFIXES)
+        self.directory = path + '.acolumns' if self.arrow else path
+
+    def __repr__(self):
+        return f'AMmapStore[{self.path!r}]'
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.directory, quote(str(name), safe='') + '.npy')
+
+    def read(self) -> Dict[str, np.ndarray]:
+        """ All the columns, the numeric ones are memory-mapped. """
+        columns = {}
+        if self.arrow:
+            try:
+                import pyarrow as pa
+            except ImportError:
+                raise ImportError('Memory-mapped Arrow IPC / Feather files require pyarrow.')
+            table = pa.ipc.open_file(pa.memory_map(self.path, 'r')).read_all()
+            for name, column in zip(table.column_names, table.columns):
+                if not name.startswith('__index_level_'):
+                    # zero-copy for the numeric columns without missing values stored in a single chunk
+                    columns[name] = column.to_numpy() if column.num_chunks == 1 and column.null_count == 0 \
+                        and pa.types.is_primitive(column.type) else column.to_pandas().to_numpy()
+        if os.path.isdir(self.directory):
+            manifest = os.path.join(self.directory, _MANIFEST)
+            names = []
+            if os.path.exists(manifest):
+                with open(manifest) as f:
+                    names = json.load(f)
+            # the columns added later go after the base ones
+            added = sorted(unquote(file[:-4]) for file in os.listdir(self.directory) if file.endswith('.npy'))
+            for name in names + [name for name in added if name not in names]:
+                columns[name] = np.load(self._file(name), mmap_mode='r')
+        return columns
+
+    def derivations(self) -> Dict[str, Tuple[Optional[str], List[str]]]:
+        """
+        The calculated columns written back to the store: name -> (fingerprint of the definition of the AColumn,
+        see `apandas.adisk.fingerprint_definition`, and the names of its input columns).
+        """
+        path = os.path.join(self.directory, _DERIVED)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return {name: (entry['definition'], entry['inputs']) for name, entry in json.load(f).items()}
+
+    def write(self, name: str, values: np.ndarray, definition: Optional[str] = None,
+              inputs: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Write the column (atomically, so the other processes never map a partially written file)
+        and return it memory-mapped. The calculated columns are recorded with the fingerprint of their
+        `definition` and the names of their `inputs` (see `derivations`).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._replace(self._file(name), lambda f: np.save(f, np.asarray(values)))
+        derivations = self.derivations()
+        if inputs is not None or name in derivations:
+            derivations.pop(name, None)
+            if inputs is not None:
+                derivations[name] = (definition, list(inputs))
+            entries = {n: {'definition': d, 'inputs': i} for n, (d, i) in derivations.items()}
+            self._replace(os.path.join(self.directory, _DERIVED), lambda f: f.write(json.dumps(entries).encode()))
+        return np.load(self._file(name), mmap_mode='r')
+
+    def _replace(self, path: str, write: Callable):
+        """ Write the file `path` by `write` atomically (through a temporary file). """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def create(self, df: pd.DataFrame):
+        """ Write all the columns of `df` as the base columns of the store (its index is not stored). """
+        if self.arrow:
+            try:
+                import pyarrow as pa
+                import pyarrow.feather as feather
+            except ImportError:
+                raise ImportError('Writing of Arrow IPC / Feather files requires pyarrow.')
+            feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), self.path,
+                                  compression='uncompressed')
+            return
+        unmappable = [name for name in df.columns if not is_mappable(df[name])]
+        if unmappable:
+            raise ValueError(f'Columns {unmappable} cannot be memory-mapped (only numeric and datetime columns can), '
+                             f'use an Arrow IPC / Feather file instead.')
+        os.makedirs(self.directory, exist_ok=True)
+        for name in df.columns:
+            self.write(name, df[name].to_numpy())
+        with open(os.path.join(self.directory, _MANIFEST), 'w') as f:
+            json.dump(list(df.columns), f)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+import itertools
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+class ArrayOp:
+    """
+    Operation of an AFunction node built by a numpy function (a ufunc, `np.where` or `np.clip`). It is applied
+    directly to the numpy arrays underlying its pd.Series operands and the result is wrapped back into a pd.Series
+    with their index. Operands that are not aligned on the same index or that have pandas extension dtypes are
+    left to pandas. The operations of the same function are equal, so the structural keys of the nodes are too.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = getattr(func, '__name__', repr(func))
+        # calculates every row only from the same row (see `apandas.alazy.ROW_LOCAL`) and can be fused
+        # (see `apandas.acompile`)
+        self.elementwise = (isinstance(func, np.ufunc) and func.nout == 1) or func in ARRAY_FUNCTIONS
+
+    def __call__(self, *args, **kwargs):
+        series = [x for x in itertools.chain(args, kwargs.values()) if isinstance(x, pd.Series)]
+        if not series:
+            return self.func(*args, **kwargs)
+        index, constructor = series[0].index, series[0]._constructor
+        if all(isinstance(s.dtype, np.dtype) and (s.index is index or s.index.equals(index)) for s in series):
+            args = [x.to_numpy() if isinstance(x, pd.Series) else x for x in args]
+            kwargs = {k: (v.to_numpy() if isinstance(v, pd.Series) else v) for k, v in kwargs.items()}
+        result = self.func(*args, **kwargs)
+        if isinstance(result, np.ndarray) and result.ndim == 1 and len(result) == len(index):
+            return constructor(result, index=index)
+        return result
+
+    def __eq__(self, other):
+        return isinstance(other, ArrayOp) and other.func is self.func
+
+    def __hash__(self):
+        return hash((ArrayOp, self.func))
+
+    def __repr__(self):
+        return f'ArrayOp[{self.__name__}]'
+
+    def __reduce__(self):
+        return array_op, (self.func,)
+
+
+# elementwise numpy functions (other than ufuncs) that AFunctions support
+ARRAY_FUNCTIONS = {np.where, np.clip}
+
+_array_ops = {}
+
+
+def array_op(func) -> ArrayOp:
+    """ The operation applying the numpy `func` (one instance per function). """
+    op = _array_ops.get(func)
+    if op is None:
+        op = _array_ops[func] = ArrayOp(func)
+    return op
+
+
+# the numpy functions that pandas dispatches to the pd.Series methods:
+# numpy function -> (method name, its positional parameters after the array, the parameters passed to the method)
+_SERIES_METHODS = {
+    np.sum: ('sum', ['axis', 'dtype', 'out'], {}),
+    np.prod: ('prod', ['axis', 'dtype', 'out'], {}),
+    np.mean: ('mean', ['axis', 'dtype', 'out'], {}),
+    np.min: ('min', ['axis', 'out'], {}),
+    np.amin: ('min', ['axis', 'out'], {}),
+    np.max: ('max', ['axis', 'out'], {}),
+    np.amax: ('max', ['axis', 'out'], {}),
+    # numpy defaults to the population variance, pandas to the sample one
+    np.std: ('std', ['axis', 'dtype', 'out', 'ddof'], {'ddof': 0}),
+    np.var: ('var', ['axis', 'dtype', 'out', 'ddof'], {'ddof': 0}),
+    np.round: ('round', ['decimals', 'out'], {'decimals': 0}),
+    np.around: ('round', ['decimals', 'out'], {'decimals': 0}),
+    np.cumsum: ('cumsum', ['axis', 'dtype', 'out'], {}),
+    np.cumprod: ('cumprod', ['axis', 'dtype', 'out'], {}),
+}
+
+# the delegated pd.Series methods reducing the whole column to a scalar
+REDUCTIONS = {getattr(pd.Series, name) for name in ['sum', 'prod', 'mean', 'median', 'min', 'max', 'std', 'var',
+                                                    'count']}
+
+
+def series_method(func, args: tuple, kwargs: dict) -> Optional[Tuple[str, dict]]:
+    """
+    The pd.Series method (its name and keyword arguments) equivalent to the call of the numpy `func` on the `args`
+    (the first one is the array) and `kwargs`, as pandas dispatches it. None if there is no such method or if the
+    call uses something the method does not support (an axis, a dtype or an output array).
+    """
+    entry = _SERIES_METHODS.get(func)
+    if entry is None or len(args) > 1 + len(entry[1]):
+        return None
+    name, params, passed = entry
+    kwargs = {**passed, **dict(zip(params, args[1:])), **kwargs}
+    if kwargs.pop('axis', None) not in [None, 0]:
+        return None
+    if any(k not in params or (k not in passed and v is not None) for k, v in kwargs.items()):
+        return None
+    return name, {k: v for k, v in kwargs.items() if k in passed}
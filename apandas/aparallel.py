@@ -0,0 +1,228 @@
+from __future__ import annotations
+import concurrent.futures
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+from .acolumn import AFunction, AColumn
+from .aeval import evaluate
+from .alazy import is_row_local_node
+from .aprofile import Timing
+from .ascan import SCANS, diff_window, last_value, periods
+
+EXECUTORS = ['thread', 'process']
+
+# the function and the items of the current map, inherited by the forked worker processes (so nothing is pickled)
+_forked = None
+
+
+def levels(order: List[AColumn]) -> List[List[AColumn]]:
+    """
+    Split the topologically sorted AColumns into waves - every AColumn depends only on the AColumns from
+    the previous waves, so all the AColumns within a wave can be calculated at the same time.
+    """
+    level = {}
+    waves = []
+    for acol in order:
+        level[acol.name] = 1 + max((level[dep.name] for dep in acol.dependencies if dep.name in level), default=-1)
+        if level[acol.name] == len(waves):
+            waves.append([])
+        waves[level[acol.name]].append(acol)
+    return waves
+
+
+def evaluate_timed(acol: AColumn, af, memo: dict, arena=None) -> Tuple[object, Timing]:
+    """ Evaluate `acol` and measure the calculation (in place with `arena`, see `apandas.aeval.evaluate`). """
+    with Timing() as timing:
+        value = evaluate(acol, af, memo, engine=acol.engine or af.engine, arena=arena)
+    return value, timing
+
+
+def _forked_task(i: int):
+    func, items, indexes = _forked
+    value, extra = func(items[i])
+    return _to_shared(value, indexes[i]), extra
+
+
+def _to_shared(value, index: pd.Index):
+    """ Numeric columns are passed back to the main process in a shared memory block instead of pickling. """
+    if isinstance(value, pd.Series) and isinstance(value.dtype, np.dtype) and value.dtype.kind in 'biufcmM' \
+            and value.index.equals(index):
+        from multiprocessing.shared_memory import SharedMemory
+        array = value.to_numpy()
+        shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+        shm.close()
+        return 'shared', shm.name, array.dtype.str, len(array), value.name
+    return 'value', value
+
+
+def _from_shared(result, index: pd.Index):
+    if result[0] == 'value':
+        return result[1]
+    from multiprocessing.shared_memory import SharedMemory
+    _, name, dtype, length, series_name = result
+    shm = SharedMemory(name=name)
+    try:
+        array = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return pd.Series(array, index=index, name=series_name)
+
+
+def pool_map(func: Callable, items: Sequence, executor: Union[str, concurrent.futures.Executor],
+             max_workers: Optional[int] = None, indexes: Optional[Sequence[pd.Index]] = None) -> list:
+    """
+    Map `func` returning pairs `(value, extra)` over `items` on the `executor`: 'thread' (for the calculations that
+    release the GIL, such as numpy operations), 'process' (for pure Python functions, the workers are forked and
+    inherit `func` and `items`, so they are not pickled; the values that are numeric pd.Series aligned with
+    `indexes` are passed back in shared memory) or any `concurrent.futures.Executor` accepting arbitrary callables
+    (it is not shut down). `max_workers` sets the size of the created pools. The 'process' executor needs the 'fork'
+    start method, so it raises ValueError where it is not available (on Windows), use a 'thread' or a custom
+    executor there.
+    """
+    global _forked
+    if executor == 'process':
+        # multiprocessing is imported only when it is used, to keep `import apandas` fast
+        import multiprocessing
+        from multiprocessing import resource_tracker
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise ValueError("The 'process' executor forks the workers, but the 'fork' start method is not available "
+                             "on this platform. Use the 'thread' executor or a concurrent.futures.Executor instead.")
+        indexes = [None] * len(items) if indexes is None else indexes
+        resource_tracker.ensure_running()
+        _forked = func, items, indexes
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                        mp_context=multiprocessing.get_context('fork')) as pool:
+                results = list(pool.map(_forked_task, range(len(items))))
+        finally:
+            _forked = None
+        return [(_from_shared(value, index), extra) for (value, extra), index in zip(results, indexes)]
+    elif executor == 'thread':
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(func, items))
+    elif isinstance(executor, concurrent.futures.Executor):
+        return [f.result() for f in [executor.submit(func, item) for item in items]]
+    raise ValueError(f'Unknown executor {executor!r}, use one of {EXECUTORS} or a concurrent.futures.Executor.')
+
+
+def evaluate_parallel(af, order: List[AColumn], memo: dict,
+                      executor: Union[str, concurrent.futures.Executor], max_workers: Optional[int] = None
+                      ) -> Iterator[Tuple[AColumn, object, Timing]]:
+    """
+    Evaluate the AColumns from `order` (sorted by waves, see `levels`) in parallel on the `executor` (see `pool_map`)
+    and yield them with their values and timings in the same order. The next wave is calculated only
+    after the caller resumes the iteration, so it can add the values of the previous wave to the frame first.
+    """
+    for wave in levels(order):
+        results = pool_map(lambda acol: evaluate_timed(acol, af, memo), wave, executor, max_workers,
+                           indexes=[af.index] * len(wave))
+        for acol, (value, timing) in zip(wave, results):
+            yield acol, value, timing
+
+
+def _partition_scans(acol: AColumn) -> Optional[List[AFunction]]:
+    """
+    Scans (cumsum, cumprod, diff) in the definition of `acol` in post-order (the nested ones first), or None
+    if the definition cannot be calculated by row partitions. The AColumns it depends on are already calculated.
+    """
+    scans = []
+    stack = [(acol, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            scans.append(node)
+            continue
+        if isinstance(node, AColumn) and node is not acol:
+            continue
+        if not is_row_local_node(node, SCANS):
+            return None
+        if node.op in SCANS:
+            if not isinstance(node.args[0], AFunction):
+                return None
+            stack.append((node, True))
+        stack.extend((x, False) for x in node.operands)
+    return scans
+
+
+def evaluate_partitioned(acol: AColumn, af, memo: dict, partitions: int,
+                         executor: Union[str, concurrent.futures.Executor] = 'thread',
+                         max_workers: Optional[int] = None) -> Tuple[object, Timing]:
+    """
+    Evaluate `acol` on `partitions` row partitions of `af` in parallel on the `executor` (see `pool_map`) and
+    return its value (concatenated from the partitions) and the timing of the calculation. Only the definitions
+    built from row-local operations (see `apandas.alazy.is_row_local`) and the scans (cumsum, cumprod, diff) are
+    partitioned, the scans are calculated by partitions as well and fixed up on the partition boundaries.
+    Anything else is evaluated at once.
+    """
+    scans = _partition_scans(acol)
+    if scans is None or partitions < 2 or len(af) < partitions:
+        return evaluate_timed(acol, af, memo)
+    with Timing() as timing:
+        value = _evaluate_by_partitions(acol, scans, af, memo, partitions, executor, max_workers)
+    return value, timing
+
+
+def _evaluate_by_partitions(acol: AColumn, scans: List[AFunction], af, memo: dict, partitions: int, executor,
+                            max_workers: Optional[int]):
+    n = len(af)
+    engine = acol.engine or af.engine
+    bounds = np.linspace(0, n, partitions + 1).astype(int)
+    slices = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+    indexes = [af.index[s] for s in slices]
+    # only the already calculated values of the dependencies kept in the memo (scratch AColumns) are needed
+    local_memo = {dep.key: memo[dep.key] for dep in acol.dependencies if dep.key in memo}
+
+    def run(afunc: AFunction) -> pd.Series:
+        if isinstance(afunc, AColumn) and afunc is not acol:
+            # already calculated
+            return local_memo[afunc.key] if afunc.key in local_memo else af[afunc]
+
+        def task(s: slice):
+            part_memo = {k: (v.iloc[s] if isinstance(v, pd.Series) and len(v) == n else v)
+                         for k, v in local_memo.items()}
+            return evaluate(afunc, af.iloc[s], part_memo, engine=engine), None
+        parts = pool_map(task, slices, executor, max_workers, indexes=indexes)
+        return pd.concat([part for part, _ in parts])
+
+    for scan in scans:
+        series = run(scan.args[0])
+        local_memo[scan.args[0].key] = series
+        local_memo[scan.definition_key] = _scan(scan, series, slices, executor, max_workers, indexes)
+    if acol.definition_key in local_memo:
+        value = local_memo[acol.definition_key]
+    else:
+        value = run(acol)
+    memo[acol.definition_key] = value
+    return value
+
+
+def _scan(scan: AFunction, series: pd.Series, slices: List[slice], executor, max_workers, indexes) -> pd.Series:
+    """ Calculate the `scan` over `series` by partitions and fix up the partition boundaries. """
+    args, kwargs = scan.args[1:], scan.kwargs
+    if scan.op is pd.Series.diff:
+        diff_periods = periods(args, kwargs)
+
+        def diff_task(s: slice):
+            # partitions extended by the neighbouring rows the differences at the boundaries need
+            window = diff_window(s.start, s.stop, len(series), diff_periods)
+            return scan.op(series.iloc[window], *args, **kwargs).iloc[s.start - window.start:s.stop - window.start], \
+                None
+        parts = pool_map(diff_task, slices, executor, max_workers, indexes=indexes)
+        return pd.concat([part for part, _ in parts])
+
+    # local scans in parallel, the last values of the previous partitions are carried sequentially
+    parts = [part for part, _ in pool_map(lambda s: (scan.op(series.iloc[s], *args, **kwargs), None), slices,
+                                          executor, max_workers, indexes=indexes)]
+    combine = SCANS[scan.op]
+    carries = []
+    carry = None
+    for part in parts:
+        carries.append(carry)
+        last = last_value(part, kwargs.get('skipna', True))
+        if last is not None:
+            carry = last if carry is None else combine(last, carry)
+    fixed = pool_map(lambda i: (parts[i] if carries[i] is None else combine(parts[i], carries[i]), None),
+                     range(len(parts)), executor, max_workers, indexes=indexes)
+    return pd.concat([part for part, _ in fixed])
@@ -0,0 +1,151 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import Callable, List, Optional, Tuple
+import pandas as pd
+
+# callables receiving an AColumnEvent for every AColumn requested from an AFrame
+_observers = []
+
+
+def add_observer(observer: Callable[[AColumnEvent], None]):
+    """ Register `observer` to be called with an `AColumnEvent` for every AColumn requested from any AFrame. """
+    _observers.append(observer)
+
+
+def remove_observer(observer: Callable[[AColumnEvent], None]):
+    _observers.remove(observer)
+
+
+def observing() -> bool:
+    return bool(_observers)
+
+
+def notify(event: AColumnEvent):
+    for observer in list(_observers):
+        observer(event)
+
+
+class Timing:
+    """
+    Measures the wall time and the CPU time of the current thread of a block of code, and the peak of the memory
+    allocated in the block if `tracemalloc` is tracing (the memory is measured for the whole process).
+    """
+    def __init__(self):
+        self.start = None
+        self.wall = 0.
+        self.cpu = 0.
+        self.peak_memory = None
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.get_ident()
+        if tracemalloc.is_tracing():
+            self._memory_before = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+                tracemalloc.reset_peak()
+        self._cpu_start = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.thread_time() - self._cpu_start
+        if tracemalloc.is_tracing() and hasattr(self, '_memory_before'):
+            self.peak_memory = max(tracemalloc.get_traced_memory()[1] - self._memory_before, 0)
+        return False
+
+
+class AColumnEvent:
+    """
+    Report about an AColumn requested from an AFrame: either calculated (with its timing and the size of
+    the result) or a hit (it has already been present in the frame). The `chain` lists the names of the AColumns
+    from the requested one down to this one, so it shows why the AColumn has been calculated.
+    """
+    def __init__(self, name: str, chain: Tuple[str, ...], hit: bool, timing: Optional[Timing] = None,
+                 nbytes: int = 0):
+        self.name = name
+        self.chain = chain
+        self.hit = hit
+        self.timing = timing
+        self.nbytes = nbytes
+
+    def __repr__(self):
+        if self.hit:
+            return f"AColumnEvent['{self.name}', hit]"
+        return f"AColumnEvent['{self.name}', {1e3 * self.timing.wall:.3f} ms, {self.nbytes} bytes]"
+
+
+class AProfiler:
+    """
+    Collects the AColumnEvents while active (as a context manager). With `memory=True`, it also starts
+    `tracemalloc` to measure the peak memory of every calculation (which slows down the calculations).
+
+    .. code:: python
+
+        with AProfiler() as profiler:
+            af[z]
+        print(profiler.report(top=10))
+        profiler.to_chrome_trace('trace.json')  # open in chrome://tracing or https://ui.perfetto.dev
+    """
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.events: List[AColumnEvent] = []
+        self._tracing = False
+
+    def __call__(self, event: AColumnEvent):
+        self.events.append(event)
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        add_observer(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_observer(self)
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        return False
+
+    def report(self, top: Optional[int] = 10) -> pd.DataFrame:
+        """ The `top` slowest AColumns with their total wall and CPU times, peak memory, sizes and hit counts. """
+        rows = {}
+        for e in self.events:
+            row = rows.setdefault(e.name, {'calculated': 0, 'hits': 0, 'wall': 0., 'cpu': 0., 'peak_memory': None,
+                                           'nbytes': 0, 'chain': ' <- '.join(e.chain)})
+            if e.hit:
+                row['hits'] += 1
+                continue
+            row['calculated'] += 1
+            row['wall'] += e.timing.wall
+            row['cpu'] += e.timing.cpu
+            if e.timing.peak_memory is not None:
+                row['peak_memory'] = max(row['peak_memory'] or 0, e.timing.peak_memory)
+            row['nbytes'] = e.nbytes
+            row['chain'] = ' <- '.join(e.chain)
+        report = pd.DataFrame.from_dict(rows, orient='index',
+                                        columns=['calculated', 'hits', 'wall', 'cpu', 'peak_memory', 'nbytes',
+                                                 'chain'])
+        report = report.sort_values('wall', ascending=False, kind='stable')
+        return report if top is None else report.head(top)
+
+    def to_chrome_trace(self, path: Optional[str] = None) -> dict:
+        """ The calculations in the Chrome trace event format (written to `path` as JSON if given). """
+        pid = os.getpid()
+        events = [{
+            'name': e.name, 'cat': 'acolumn', 'ph': 'X', 'pid': pid, 'tid': e.timing.thread,
+            'ts': 1e6 * e.timing.start, 'dur': 1e6 * e.timing.wall,
+            'args': {'cpu': e.timing.cpu, 'peak_memory': e.timing.peak_memory, 'nbytes': e.nbytes,
+                     'chain': list(e.chain)},
+        } for e in self.events if not e.hit]
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+        return trace
@@ -0,0 +1,37 @@
+from __future__ import annotations
+import operator
+import numpy as np
+import pandas as pd
+
+# scans over the rows that can be calculated by parts of the rows (partitions or chunks) with a carry from the previous
+# parts: cumulative operation -> how to combine its result with the carried last value of the previous parts
+# (diff carries the last rows of its operand instead)
+SCANS = {
+    pd.Series.cumsum: operator.add,
+    pd.Series.cumprod: operator.mul,
+    pd.Series.diff: None,
+}
+
+
+def periods(args: tuple, kwargs: dict) -> int:
+    """ Periods of diff called with `args` (without the series) and `kwargs`. """
+    return args[0] if args else kwargs.get('periods', 1)
+
+
+def last_value(result: pd.Series, skipna: bool = True):
+    """
+    The value of the cumulated `result` carried to the following rows - its last value (the last valid one with
+    `skipna`), or None if there is none.
+    """
+    if skipna:
+        valid = np.flatnonzero(result.notna().to_numpy())
+        return result.iloc[valid[-1]] if len(valid) else None
+    return result.iloc[-1] if len(result) else None
+
+
+def diff_window(start: int, stop: int, n: int, diff_periods: int) -> slice:
+    """
+    Rows of the operand of diff (out of `n`) needed for the differences of the rows `start:stop` - extended by
+    the neighbouring rows before (or after, for negative periods).
+    """
+    return slice(max(start - max(diff_periods, 0), 0), min(stop - min(diff_periods, 0), n))
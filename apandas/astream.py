@@ -0,0 +1,229 @@
+from __future__ import annotations
+from typing import Iterable, Iterator, List, Optional, Union
+import pandas as pd
+from .acolumn import AFunction, AColumn
+from .aeval import evaluate
+from .aframe import AFrame
+from .agraph import toposort
+from .agroup import group_transform
+from .alazy import is_row_local, is_row_local_node
+from .anumpy import REDUCTIONS
+from .ascan import SCANS, diff_window, last_value, periods
+
+
+class _Cumulative:
+    """ Cumulative operation (cumsum, cumprod) that carries the last value from one chunk to the next one. """
+    def __init__(self, op):
+        self.op = op
+        self.carry = None
+
+    def __call__(self, s, *args, **kwargs):
+        result = self.op(s, *args, **kwargs)
+        if self.carry is not None:
+            result = SCANS[self.op](result, self.carry)
+        self.remember(result, *args, **kwargs)
+        return result
+
+    def remember(self, result, *args, **kwargs):
+        """ Carry the last value of the cumulated `result` to the next chunk. """
+        last = last_value(result, kwargs.get('skipna', True))
+        if last is not None:
+            self.carry = last
+
+
+class _Diff:
+    """ Difference that uses the last rows of the previous chunk for the first rows of the next one. """
+    def __init__(self):
+        self.tail = None
+
+    def __call__(self, s, *args, **kwargs):
+        if periods(args, kwargs) < 0:
+            raise NotImplementedError('diff with negative periods cannot be streamed (needs the following chunk).')
+        extended = s if self.tail is None else pd.concat([self.tail, s])
+        result = pd.Series.diff(extended, *args, **kwargs).iloc[len(extended) - len(s):]
+        self.remember(extended, *args, **kwargs)
+        return result
+
+    def remember(self, s, *args, **kwargs):
+        """ Keep the last rows of `s` (the operand of diff) for the next chunk. """
+        self.tail = s.iloc[diff_window(len(s), len(s), len(s), periods(args, kwargs))]
+
+
+# stateful replacements of the delegated pd.Series methods that work across several rows
+_STATEFUL = {
+    pd.Series.cumsum: lambda: _Cumulative(pd.Series.cumsum),
+    pd.Series.cumprod: lambda: _Cumulative(pd.Series.cumprod),
+    pd.Series.diff: _Diff,
+}
+
+
+def _stateful_ops(order: List[AColumn]) -> dict:
+    """ A new stateful operation for every node of the AColumn definitions that works across several rows. """
+    ops = {}
+    for acol in order:
+        stack = [acol]
+        while stack:
+            node = stack.pop()
+            if node.op is group_transform:
+                raise NotImplementedError('Grouped AFunctions cannot be streamed (the groups span all the chunks).')
+            if node.op in REDUCTIONS:
+                raise NotImplementedError('Reductions cannot be streamed (they span all the chunks).')
+            if node.op in _STATEFUL and node.definition_key not in ops:
+                ops[node.definition_key] = _STATEFUL[node.op]()
+            stack.extend(x for x in node.operands if not isinstance(x, AColumn))
+    return ops
+
+
+def _periods(node: AFunction) -> int:
+    """ Periods of the diff `node`. """
+    return periods(node.args[1:], node.kwargs)
+
+
+def _scans(afunc: AFunction) -> List[AFunction]:
+    """ Nodes of the definition of `afunc` with a stateful operation, the outer ones first. """
+    scans, stack = [], [afunc]
+    while stack:
+        node = stack.pop()
+        if node.op in _STATEFUL:
+            scans.append(node)
+        stack.extend(reversed([x for x in node.operands if not isinstance(x, AColumn)]))
+    return scans
+
+
+def is_streamable(acol: AColumn) -> bool:
+    """
+    Can the definition of `acol` be calculated by parts of the rows, one after another, with the stateful operations
+    (see `_STATEFUL`)? It can consist only of the row-local operations (see `apandas.alazy.ROW_LOCAL`), the functions
+    declared by `AFunction.rowwise`, `cumsum`, `cumprod` and `diff` with non-negative periods. The AColumns it
+    depends on are not looked into.
+    """
+    stack = [acol]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, AColumn) and node is not acol:
+            continue
+        if not is_row_local_node(node, _STATEFUL) or (node.op is pd.Series.diff and _periods(node) < 0):
+            return False
+        stack.extend(node.operands)
+    return True
+
+
+def prime_stateful_ops(ops: dict, primed: set, order: List[AColumn], af: AFrame):
+    """
+    Set the state of the stateful operations `ops` of the AColumns in `order` (topologically sorted) as if all the
+    rows of `af` had been streamed through them, so they continue with the next rows. The definition keys of the
+    operations already in that state are in `primed`, the newly primed ones are added to it.
+
+    Where possible, the state is taken from the tail of the frame only - the last value of a cumulative AColumn
+    stored in the frame or the last rows of the row-local operand of diff. Other operations are run over all the
+    rows of the frame.
+    """
+    memo = {}
+    for i, acol in enumerate(order):
+        for scan in _scans(acol):
+            key = scan.definition_key
+            if key in primed:
+                continue
+            op, args = ops[key], scan.args[1:]
+            nested = len(_scans(scan)) > 1
+            if isinstance(op, _Cumulative) and not nested and key == acol.definition_key and acol.name in af.columns:
+                op.remember(pd.DataFrame.__getitem__(af, acol.name), *args, **scan.kwargs)
+                primed.add(key)
+            elif isinstance(op, _Diff) and not nested and is_row_local(scan.args[0], af):
+                tail, operand = af.iloc[max(len(af) - _periods(scan), 0):], scan.args[0]
+                if isinstance(operand, AColumn) and operand.name in af.columns:
+                    value = pd.DataFrame.__getitem__(tail, operand.name)
+                else:
+                    value = evaluate(operand, tail)
+                op.remember(value, *args, **scan.kwargs)
+                primed.add(key)
+            else:
+                # the AColumns kept out of the frame are not stored anywhere, so they are calculated again
+                for dep in order[:i]:
+                    if dep.name not in af.columns and dep.key not in memo:
+                        memo[dep.key] = evaluate(dep, af, memo)
+                evaluate(scan, af, memo, ops={k: v for k, v in ops.items() if k not in primed})
+                primed.update(x.definition_key for x in _scans(scan))
+
+
+def _read_chunks(source: Union[str, Iterable[pd.DataFrame]], chunksize: int, read_columns: Optional[List[str]] = None,
+                 **read_kwargs) -> Iterator[pd.DataFrame]:
+    if not isinstance(source, str):
+        yield from (chunk if read_columns is None else chunk[read_columns] for chunk in source)
+    elif source.endswith('.parquet') or source.endswith('.pq'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Streaming of parquet files requires pyarrow.')
+        offset = 0
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize, columns=read_columns, **read_kwargs):
+            chunk = batch.to_pandas()
+            # continuous index, as if the whole file was read at once
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            yield chunk
+    else:
+        with pd.read_csv(source, chunksize=chunksize, usecols=read_columns, **read_kwargs) as reader:
+            yield from reader
+
+
+def stream(source: Union[str, Iterable[pd.DataFrame]], columns: List[Union[AColumn, str]], chunksize: int = 100_000,
+           engine: Optional[str] = None, read_columns: Optional[List[str]] = None, **read_kwargs) -> Iterator[AFrame]:
+    """
+    Evaluate `columns` (AColumns or names of source columns) over `source` chunk by chunk, so the whole dataset
+    never has to be in memory. Yields an AFrame with `columns` for every chunk.
+
+    The `source` is a path to a CSV file (read by `pd.read_csv` with `read_kwargs`), to a parquet file (`.parquet`
+    or `.pq`, read in batches by pyarrow) or any iterable of pd.DataFrames. Only the source columns `read_columns`
+    are read, if given (the `usecols` of `pd.read_csv`, the `columns` of the parquet reader).
+
+    The row-wise AColumns are simply calculated for every chunk, `cumsum`, `cumprod` and `diff` carry their state
+    from one chunk to the next one, so the results are the same as for the whole dataset. Opaque functions (lambdas)
+    are applied chunk by chunk, so they have to be declared row-wise by `AFunction.rowwise`. Anything else spanning several rows (such as
+    `fillna(method='ffill')` or an undeclared opaque function) raises NotImplementedError, see `is_streamable`.
+    """
+    order = toposort(x for x in columns if isinstance(x, AColumn))
+    ops = _stateful_ops(order)
+    for acol in order:
+        if not is_streamable(acol):
+            raise NotImplementedError(f"AColumn '{acol.name}' cannot be streamed, its definition uses an operation "
+                                      f"that may span several chunks (declare the row-wise opaque functions by "
+                                      f"`AFunction.rowwise`, see `is_streamable`).")
+    names = [x.name if isinstance(x, AColumn) else x for x in columns]
+    for chunk in _read_chunks(source, chunksize, read_columns, **read_kwargs):
+        af = AFrame(chunk, engine=engine)
+        memo = {}
+        for acol in order:
+            af[acol.name] = evaluate(acol, af, memo, engine=acol.engine or engine, ops=ops)
+        yield af[names]
+
+
+def write_stream(chunks: Iterable[pd.DataFrame], path: str, **write_kwargs) -> int:
+    """
+    Write `chunks` (for instance from `stream`) to a CSV or a parquet (`.parquet` or `.pq`, requires pyarrow) file
+    without holding them in memory. Returns the number of written rows.
+    """
+    rows = 0
+    if path.endswith('.parquet') or path.endswith('.pq'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Writing of parquet files requires pyarrow.')
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(pd.DataFrame(chunk), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, **write_kwargs)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for i, chunk in enumerate(chunks):
+            pd.DataFrame(chunk).to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False,
+                                       **write_kwargs)
+            rows += len(chunk)
+    return rows
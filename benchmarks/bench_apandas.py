@@ -0,0 +1,137 @@
+"""
+Benchmarks of apandas overhead relative to plain pandas.
+
+Every benchmark prepares the same data as an AFrame and as a pd.DataFrame and times an equivalent operation
+on both, the reported overhead is the ratio of the apandas time to the pandas time. Run (with apandas installed,
+for instance by `pip install -e .`) as
+
+    python benchmarks/bench_apandas.py [--rows 1000 100000 1000000] [--repeat 5] [--filter groupby]
+"""
+import argparse
+import timeit
+import numpy as np
+import pandas as pd
+from apandas import AColumn, AFrame
+
+
+def _data(n: int, ncols: int = 4) -> dict:
+    rng = np.random.default_rng(42)
+    data = {f'c{i}': rng.normal(size=n) for i in range(ncols)}
+    data['g'] = rng.integers(0, 100, size=n)
+    return data
+
+
+def bench_access_string(n: int):
+    af, df = AFrame(_data(n)), pd.DataFrame(_data(n))
+    return lambda: af['c0'], lambda: df['c0']
+
+
+def bench_access_acolumn(n: int):
+    af, df = AFrame(_data(n)), pd.DataFrame(_data(n))
+    c0 = AColumn('c0')
+    return lambda: af[c0], lambda: df['c0']
+
+
+def bench_access_list(n: int):
+    af, df = AFrame(_data(n)), pd.DataFrame(_data(n))
+    c0, c1 = AColumn('c0'), AColumn('c1')
+    return lambda: af[[c0, c1, 'g']], lambda: df[['c0', 'c1', 'g']]
+
+
+def bench_deep_chain(n: int, depth: int = 20):
+    data = _data(n)
+    c0, c1 = AColumn('c0'), AColumn('c1')
+    expr = c0
+    for i in range(depth):
+        expr = expr * 1.01 + c1 if i % 2 else expr - c1 * 0.5
+
+    def run_apandas():
+        af = AFrame(data)
+        return af[AColumn('z', expr)]
+
+    def run_pandas():
+        df = pd.DataFrame(data)
+        z = df['c0']
+        for i in range(depth):
+            z = z * 1.01 + df['c1'] if i % 2 else z - df['c1'] * 0.5
+        df['z'] = z
+        return df['z']
+
+    return run_apandas, run_pandas
+
+
+def bench_wide_dag(n: int, width: int = 50):
+    data = _data(n)
+    c0, c1, c2 = AColumn('c0'), AColumn('c1'), AColumn('c2')
+    level1 = [AColumn(f'u{i}', c0 * i + c1) for i in range(width)]
+    level2 = [AColumn(f'v{i}', level1[i] - level1[(i + 1) % width] * c2) for i in range(width)]
+
+    def run_apandas():
+        af = AFrame(data)
+        af.materialize(level2)
+        return af
+
+    def run_pandas():
+        df = pd.DataFrame(data)
+        for i in range(width):
+            df[f'u{i}'] = df['c0'] * i + df['c1']
+        for i in range(width):
+            df[f'v{i}'] = df[f'u{i}'] - df[f'u{(i + 1) % width}'] * df['c2']
+        return df
+
+    return run_apandas, run_pandas
+
+
+def bench_groupby_agg(n: int):
+    af, df = AFrame(_data(n)), pd.DataFrame(_data(n))
+    g, c0, c1 = AColumn('g'), AColumn('c0'), AColumn('c1')
+    return lambda: af.groupby(g)[[c0, c1]].agg('sum'), lambda: df.groupby('g')[['c0', 'c1']].agg('sum')
+
+
+def bench_copy(n: int):
+    af, df = AFrame(_data(n)), pd.DataFrame(_data(n))
+    return lambda: af.copy(), lambda: df.copy()
+
+
+def bench_rename(n: int):
+    af, df = AFrame(_data(n)), pd.DataFrame(_data(n))
+    c0 = AColumn('c0')
+    return lambda: af.rename(columns={c0: 'a'}), lambda: df.rename(columns={'c0': 'a'})
+
+
+def bench_drop(n: int):
+    af, df = AFrame(_data(n)), pd.DataFrame(_data(n))
+    c0 = AColumn('c0')
+    return lambda: af.drop(columns=[c0]), lambda: df.drop(columns=['c0'])
+
+
+BENCHMARKS = {name[len('bench_'):]: func for name, func in globals().items() if name.startswith('bench_')}
+
+
+def timed(func, repeat: int) -> float:
+    """ Best time of a single call in seconds (the number of calls per measurement is determined automatically). """
+    number, _ = timeit.Timer(func).autorange()
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def run(rows, repeat: int = 5, name_filter: str = ''):
+    results = []
+    print(f'{"benchmark":<20}{"rows":>10}{"apandas [ms]":>15}{"pandas [ms]":>15}{"overhead":>10}')
+    for name, bench in BENCHMARKS.items():
+        if name_filter not in name:
+            continue
+        for n in rows:
+            run_apandas, run_pandas = bench(n)
+            t_apandas, t_pandas = timed(run_apandas, repeat), timed(run_pandas, repeat)
+            results.append((name, n, t_apandas, t_pandas))
+            print(f'{name:<20}{n:>10}{1e3 * t_apandas:>15.4f}{1e3 * t_pandas:>15.4f}{t_apandas / t_pandas:>9.2f}x')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', default='', help='run only the benchmarks containing this string')
+    args = parser.parse_args()
+    run(args.rows, repeat=args.repeat, name_filter=args.filter)
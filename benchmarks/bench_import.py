@@ -0,0 +1,46 @@
+"""
+Benchmark of the time of `import apandas` on top of the time of `import pandas`.
+
+Every measurement imports numpy and pandas and then apandas in a fresh interpreter with `-X importtime` and reads
+the cumulative import times of pandas and of the apandas modules from its report, so the time of apandas does not
+include the (already imported) numpy and pandas. The medians over the measurements are reported. Run (with
+apandas installed, for instance by `pip install -e .`) as
+
+    python benchmarks/bench_import.py [--repeat 10]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+def import_times() -> dict:
+    """ Cumulative import times (in seconds) of all the modules imported by `import apandas` in a fresh interpreter. """
+    report = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import numpy, pandas; import apandas'],
+                            capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in report.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def run(repeat: int = 10):
+    measurements = [import_times() for _ in range(repeat)]
+    modules = [name for name in measurements[0] if name == 'apandas' or name.startswith('apandas.')]
+    medians = {name: statistics.median(m.get(name, 0.) for m in measurements) for name in modules + ['pandas']}
+    overhead = medians['apandas']
+    print(f'{"module":<25}{"cumulative [ms]":>18}')
+    for name in ['pandas'] + sorted(modules, key=lambda name: -medians[name]):
+        print(f'{name:<25}{1e3 * medians[name]:>18.2f}')
+    print(f'\nimport apandas on top of pandas: {1e3 * overhead:.2f} ms')
+    return overhead
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    run(repeat=args.repeat)
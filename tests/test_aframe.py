@@ -1,6 +1,12 @@
+import json
+import multiprocessing
+import subprocess
+import sys
 import pytest
+import numpy as np
 import pandas as pd
-from apandas import AColumn, ASeries, AFrame
+from apandas import AFunction, AColumn, ASeries, AFrame, ACache, ADiskCache, AProfiler
+from apandas.aframe import AFrameGroupBy
 
 
 @pytest.fixture()
@@ -23,6 +29,15 @@ def test_initialization():
     af = AFrame(verbose=True)
 
 
+def test_import():
+    # the pandas methods are wrapped only on their first access and the slow imports are deferred until used
+    code = 'import sys, apandas; before = type(apandas.AFrame.__dict__["kurt"]).__name__; apandas.AFrame.kurt; ' \
+           'print(before, type(apandas.AFrame.__dict__["kurt"]).__name__, ' \
+           '*(m in sys.modules for m in ["multiprocessing", "concurrent.futures.process", "pyarrow.parquet"]))'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.split() == ['_LazyMethod', 'function', 'False', 'False', 'False']
+
+
 
 
 def test_types(x_y_z_and_af):
@@ -75,6 +90,20 @@ def test_getitem_iterable(x_y_z_and_af):
     assert isinstance(af[[u, v]], AFrame)
     pd.testing.assert_frame_equal(af[[u, v]].to_pandas(), pd.DataFrame({'u': [4, 5, 6], 'v': [3, 6, 9]}))
 
+    # plain and AColumn keys can be mixed, nested AColumns are found as well
+    pd.testing.assert_frame_equal(af[['x', u]].to_pandas(), pd.DataFrame({'x': [1, 2, 3], 'u': [4, 5, 6]}))
+    assert isinstance(af['x'], ASeries)
+    res = af.agg({v: 'sum', 'y': 'max'})
+    assert res.to_dict() == {'v': 18, 'y': 3}
+
+    # the arguments passed by the user are not modified, array-likes are passed as they are
+    w = AColumn('w', x - y)
+    values = {w: list(range(-2, 1)) + [AColumn('ignored')], 'x': np.array([1, 3])}
+    res = af.isin(values)
+    assert list(values) == [w, 'x'] and isinstance(values['x'], np.ndarray)
+    assert res[['w', 'x']].to_dict('list') == {'w': [True, True, True], 'x': [True, False, True]}
+    assert af.drop(columns=[u, v, w]).columns.tolist() == ['x', 'y']
+
 
 def test_drop_columns(x_y_z_and_af):
     x, y, z, af = x_y_z_and_af
@@ -118,6 +147,21 @@ def test_preserve_aframe(x_y_z_and_af):
     assert isinstance(af.drop(columns=x), AFrame)
     assert isinstance(af.rename(columns={x: 'a'}), AFrame)
 
+    # so do slicing and arithmetic, the slices are wrapped without copying the data
+    head = af.iloc[:2]
+    assert isinstance(head, AFrame) and head[z].tolist() == [6, 12]
+    assert np.shares_memory(head['x'].to_numpy(), af['x'].to_numpy())
+    assert isinstance(af.head(1), AFrame) and af.head(1)[y].tolist() == [3]
+    shifted = af + 1
+    assert isinstance(shifted, AFrame) and shifted[x].tolist() == [2, 3, 4]
+    s = af[x].iloc[1:]
+    assert isinstance(s, ASeries) and s.name == 'x' and np.shares_memory(s.to_numpy(), af['x'].to_numpy())
+    doubled = af[x] * 2
+    assert isinstance(doubled, ASeries) and doubled.tolist() == [2, 4, 6]
+    copied = af.copy()
+    copied[x] = [0, 0, 0]
+    assert af[x].tolist() == [1, 2, 3] and isinstance(af[x].copy(), ASeries)
+
 
 def test_groupby(x_y_z_and_af):
     x, y, z, af = x_y_z_and_af
@@ -144,6 +188,40 @@ def test_groupby(x_y_z_and_af):
     pd.testing.assert_frame_equal(pd_res, apd_res.to_pandas())
 
 
+def test_groupby_cache(x_y_z_and_af):
+    x, y, z, af = x_y_z_and_af
+    af['g'] = [1, 2, 1]
+    af[z]
+    df = af.to_pandas()
+    grouper = af.groupby(['g', x]).grouper
+    # the grouper is reused by any later groupby by the same keys, even the selections and aggregations
+    assert af.groupby(['g', 'x']).grouper is grouper
+    assert af.groupby(['g', x])[y].grouper is grouper
+    pd.testing.assert_frame_equal(af.groupby(['g', x]).agg({'y': 'sum', 'z': 'max'}).to_pandas(),
+                                  df.groupby(['g', 'x']).agg({'y': 'sum', 'z': 'max'}))
+    assert af.groupby(['g', x], sort=False).grouper is not grouper
+    # unless a key or the index is changed
+    af['g'] = [1, 1, 2]
+    assert af.groupby(['g', x]).grouper is not grouper
+    pd.testing.assert_series_equal(af.groupby(['g', x])[y].sum().to_pandas(),
+                                   af.to_pandas().groupby(['g', 'x'])['y'].sum())
+    grouper = af.groupby('g').grouper
+    af.index = ['a', 'b', 'c']
+    assert af.groupby('g').grouper is not grouper
+    # the grouped AFunctions reuse the grouping as well
+    af.materialize([AColumn('s', y.group_sum(by=AColumn('g')))])
+    groupings = dict(af._groupings)
+    af.materialize([AColumn('m', z.group_mean(by=AColumn('g')))])
+    assert af._groupings == groupings
+    pd.testing.assert_series_equal(af['m'], af.groupby('g')['z'].transform('mean'), check_names=False)
+    # anything else is left to pandas, including the validation of the arguments
+    with pytest.raises(TypeError, match="supply one of 'by' and 'level'"):
+        af.groupby()
+    grouped = af.groupby(level=0)
+    assert isinstance(grouped, AFrameGroupBy)
+    pd.testing.assert_frame_equal(grouped[['y']].sum().to_pandas(), af.to_pandas().groupby(level=0)[['y']].sum())
+
+
 def test_groupby_apply(x_y_z_and_af):
     # for AFrameGroupBy
     x, y, z, af = x_y_z_and_af
@@ -201,3 +279,463 @@ def test_groupby_apply(x_y_z_and_af):
     pd.testing.assert_frame_equal(res_apply.to_pandas(), pd_res_apply)
 
 
+def test_materialize(x_y_z_and_af):
+    x, y, z, af = x_y_z_and_af
+    u = AColumn('u', x + y)
+    v = AColumn('v', x * y)
+    w = AColumn('w', v - u)
+    assert [d.name for d in w.dependencies] == ['v', 'u']
+    assert [d.name for d in z.dependencies] == ['x', 'y']
+
+    # all requested columns and their dependencies are added at once, each of them only once
+    af.materialize([w, z, u])
+    assert list(af.columns) == ['x', 'y', 'v', 'u', 'w', 'z']
+    pd.testing.assert_series_equal(af['w'].to_pandas(), pd.Series([-1, 1, 3], name='w'))
+
+    # an overriding AColumn can refer to the present column of the same name
+    af = AFrame({'x': [1., np.nan]})
+    assert af[AColumn('x', x.fillna(0), override=True)].tolist() == [1., 0.]
+    assert af[AColumn('t', AColumn('x', x * 2, override=True) + 1)].tolist() == [3., 1.]
+
+
+def test_add_acolumns():
+    x, y = AColumn('x'), AColumn('y')
+    features = [AColumn(f'f{i}', x * i + y) for i in range(150)]
+    # opaque functions read the frame directly, so the columns calculated before them are already there
+    o = AColumn('o', lambda df: df['f1'] - df['y'])
+    af = AFrame({'x': [1., 2., 3.], 'y': [3, 3, 3]})
+    af.add_acolumns(features + [o, AColumn('s', lambda df: df['x'].astype(str))])
+    assert list(af.columns) == ['x', 'y'] + [f.name for f in features] + ['o', 's']
+    # the new columns of the same dtype share a single block
+    assert af._mgr.nblocks <= 6
+    assert af['f10'].tolist() == [13., 23., 33.] and af['o'].tolist() == [1., 2., 3.]
+    # also through the multi-column access
+    extra = [AColumn(f'g{i}', x - i) for i in range(150)]
+    assert af[extra + ['x']].shape == (3, 151)
+    assert af._mgr.nblocks <= 7 and af['g5'].tolist() == [-4., -3., -2.]
+
+
+def test_materialize_without_intermediates(x_y_z_and_af):
+    x, y, z, af = x_y_z_and_af
+    u = AColumn('u', x + y)
+    v = AColumn('v', x * y)
+    w = AColumn('w', v - u)
+    t = AColumn('t', w * 2)
+    af.materialize([t, v], keep_intermediates=False)
+    assert list(af.columns) == ['x', 'y', 'v', 't']
+    pd.testing.assert_series_equal(af['t'].to_pandas(), pd.Series([-2, 2, 6], name='t'))
+
+    # ephemeral columns are not kept even by default
+    af = AFrame({'x': [1, 2, 3], 'y': [3, 3, 3]})
+    e = AColumn('e', x + y, ephemeral=True)
+    f = AColumn('f', e * 2)
+    pd.testing.assert_series_equal(af[f].to_pandas(), pd.Series([8, 10, 12], name='f'))
+    assert list(af.columns) == ['x', 'y', 'f']
+    # unless requested explicitly
+    af[e]
+    assert list(af.columns) == ['x', 'y', 'f', 'e']
+    # or set on the frame
+    af = AFrame({'x': [1, 2, 3], 'y': [3, 3, 3]}, keep_intermediates=False)
+    af[w]
+    assert list(af.columns) == ['x', 'y', 'w']
+
+
+def test_materialize_deep_graph(x_y_z_and_af):
+    x, y, _, af = x_y_z_and_af
+    # deep chains of AColumns do not hit the recursion limit
+    acol = x
+    for i in range(500):
+        acol = AColumn(f'c{i}', acol + 1)
+    pd.testing.assert_series_equal(af[acol].to_pandas(), pd.Series([501, 502, 503], name='c499'))
+    assert len(af.columns) == 502
+
+
+def test_lazy(x_y_z_and_af):
+    x, y, z, af = x_y_z_and_af
+    calls = []
+
+    def count(df):
+        calls.append(len(df))
+        return df['x'] * 10
+
+    u = AColumn('u', z + 1)
+    c = AColumn('c', x.cumsum())
+    w = AColumn('w', count)
+    lazy = af.lazy().with_columns(u, c).filter(x > 1).with_columns(w)
+    assert list(af.columns) == ['x', 'y']
+    res = lazy.collect()
+    # the source frame is not modified
+    assert list(af.columns) == ['x', 'y']
+    assert isinstance(res, AFrame)
+    # u is calculated only on the filtered rows, cumsum before the filter
+    assert res.to_dict('list') == {'x': [2, 3], 'y': [3, 3], 'c': [3, 6], 'z': [12, 18], 'u': [13, 19],
+                                   'w': [20, 30]}
+    assert calls == [2]
+    # only the selected columns are calculated
+    v = AColumn('v', x - y)
+    res = af.lazy().with_columns(u, v).filter(y > 2).select(x, v).collect()
+    assert res.to_dict('list') == {'x': [1, 2, 3], 'v': [-2, -1, 0]}
+    # aggregation
+    i = AColumn('i', x % 2)
+    res = af.lazy().with_columns(v).filter(x != 2).groupby(i)[[v, z]].agg('sum').collect()
+    pd.testing.assert_frame_equal(res.to_pandas(), pd.DataFrame({'v': [-2], 'z': [24]},
+                                                                index=pd.Index([1], name='i')))
+
+
+def test_cache():
+    x = AColumn('x')
+    cols = [AColumn(f'c{i}', x * i) for i in range(5)]
+    # every column takes 8 * 100 bytes
+    cache = ACache(max_bytes=2000)
+    af = AFrame({'x': np.arange(100)}, cache=cache)
+    for c in cols[:3]:
+        af[c]
+    # the least recently used column is evicted
+    assert list(af.columns) == ['x', 'c1', 'c2']
+    assert cache.stats == {'hits': 0, 'misses': 3, 'evictions': 1, 'columns': 2, 'bytes': 1600, 'max_bytes': 2000}
+    af[cols[1]]
+    af[cols[3]]
+    assert list(af.columns) == ['x', 'c1', 'c3']
+    # evicted columns are recalculated transparently
+    pd.testing.assert_series_equal(af[cols[0]].to_pandas(), pd.Series(np.zeros(100, dtype=int), name='c0'))
+    assert cache.stats['hits'] == 1
+    assert cache.stats['misses'] == 5
+    assert cache.stats['evictions'] == 3
+    # the copies of the frame account their columns separately
+    copied = af[['x', 'c3']]
+    assert copied.cache is not cache and copied.cache.stats['bytes'] == 800 and cache.stats['bytes'] == 1600
+    copied[cols[4]]
+    copied[cols[2]]
+    assert list(copied.columns) == ['x', 'c4', 'c2'] and list(af.columns) == ['x', 'c3', 'c0']
+    assert cache.stats['columns'] == 2 and cache.stats['evictions'] == 3
+    with pytest.raises(ValueError):
+        ACache(policy='foo')
+
+
+# calculations of the AColumns in test_disk_cache (global, so it is not a part of their definitions)
+calls = []
+
+
+def scaled_x(af, factor=2):
+    calls.append('scaled_x')
+    return af['x'] * factor
+
+
+def test_disk_cache(tmp_path):
+    calls.clear()
+    y = AColumn('y')
+    u = AColumn('u', lambda af: calls.append('u') or af['x'] * 2)
+    v = AColumn('v', u + y)
+    w = AColumn('w', v.round(1))
+    s = AColumn('s', lambda af: calls.append('s') or af['x'].astype(str))
+    disk_cache = ADiskCache(str(tmp_path / 'cache'))
+    data = {'x': [1., 2., 3.], 'y': [4., 5., 6.]}
+
+    af = AFrame(data, disk_cache=disk_cache)
+    expected = af[[w, s]].to_pandas()
+    assert calls == ['u', 's']
+    # loaded in another frame with the same data, the intermediate columns are not even loaded
+    af = AFrame(data, disk_cache=disk_cache)
+    af.materialize([w, s])
+    # the loaded numeric columns stay mapped from the files of the cache
+    base = af['w'].to_numpy()
+    while not isinstance(base, np.memmap):
+        base = base.base
+    assert base.filename.startswith(str(tmp_path / 'cache'))
+    pd.testing.assert_frame_equal(af[[w, s]].to_pandas(), expected)
+    assert calls == ['u', 's'] and 'u' not in af.columns and disk_cache.stats == {'hits': 2, 'stores': 4}
+    pd.testing.assert_series_equal(af[u], pd.Series([2., 4., 6.], name='u'), check_series_type=False)
+    assert calls == ['u', 's']
+    # changed input or definition is calculated again (opaque functions depend on all the columns of the frame)
+    af = AFrame({'x': [1., 2., 3.], 'y': [4., 5., 7.]}, disk_cache=disk_cache)
+    assert af[w].tolist() == [6., 9., 13.] and calls == ['u', 's', 'u']
+    af = AFrame({'x': [1., 2., 3.], 'y': [4., 5., 7.]}, disk_cache=disk_cache)
+    af[u]
+    assert af[w].tolist() == [6., 9., 13.] and calls == ['u', 's', 'u']
+    af['y'] = [0., 0., 0.]
+    assert af[w].tolist() == [2., 4., 6.] and calls == ['u', 's', 'u']
+    assert AFrame(data, disk_cache=disk_cache)[AColumn('w', v * 1.5)].tolist() == [9., 13.5, 18.]
+    disk_cache.clear()
+    AFrame(data, disk_cache=disk_cache)[w]
+    assert calls == ['u', 's', 'u', 'u']
+    # the defaults of the arguments of the functions are a part of their definitions
+    p = AColumn('p', scaled_x)
+    assert AFrame(data, disk_cache=disk_cache)[p].tolist() == [2., 4., 6.]
+    scaled_x.__defaults__ = (3,)
+    try:
+        assert AFrame(data, disk_cache=disk_cache)[p].tolist() == [3., 6., 9.]
+    finally:
+        scaled_x.__defaults__ = (2,)
+    assert calls == ['u', 's', 'u', 'u', 'scaled_x', 'scaled_x']
+    # the loaded columns can be written like the calculated columns, without changing the cache
+    written = AFrame(data, disk_cache=disk_cache)
+    written[w]
+    written.loc[0, 'w'] = 5.
+    assert written['w'].tolist() == [5., 9., 12.] and AFrame(data, disk_cache=disk_cache)[w].tolist() == [6., 9., 12.]
+
+
+@pytest.mark.parametrize('name', ['store', 'store.feather'])
+def test_mmap(tmp_path, name):
+    if name.endswith('.feather'):
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / name)
+    x, y = AColumn('x'), AColumn('y')
+    z = AColumn('z', x * y)
+    AFrame({'x': [1., 2., 3.], 'y': [4, 5, 6]}).to_mmap(path)
+    af = AFrame.open_mmap(path)
+    assert af.columns.tolist() == ['x', 'y'] and not af['x'].to_numpy().flags.writeable
+    # the calculated AColumns are written back and mapped
+    assert af[z].tolist() == [4., 10., 18.] and not af['z'].to_numpy().flags.writeable
+    af = AFrame.open_mmap(path)
+    assert af.columns.tolist() == ['x', 'y', 'z'] and af['z'].tolist() == [4., 10., 18.]
+    with pytest.raises(ValueError):
+        af.loc[0, 'x'] = 0.
+    # the written back columns keep their definitions and inputs
+    assert not af.is_stale(z) and af[z].tolist() == [4., 10., 18.]
+    assert af[AColumn('z', x + y, override=True)].tolist() == [5., 7., 9.]
+    af = AFrame.open_mmap(path)
+    af['y'] = [1, 1, 1]
+    assert af.is_stale(z) and af[z].tolist() == [1., 2., 3.]
+    af = AFrame.open_mmap(path)
+    # unless they are calculated from the columns written in this process
+    af['x'] = [0., 0., 0.]
+    assert af[AColumn('w', x + y)].tolist() == [4., 5., 6.]
+    assert af['w'].to_numpy().flags.writeable
+    assert 'w' not in AFrame.open_mmap(path).columns
+    if not name.endswith('.feather'):
+        with pytest.raises(ValueError):
+            AFrame({'s': ['a']}).to_mmap(str(tmp_path / 'other'))
+
+
+def test_compact():
+    x, y = AColumn('x'), AColumn('y')
+    columns = [AColumn('flag', x * 0 + 1), AColumn('half', x / 2), AColumn('third', x / 3),
+               AColumn('label', lambda af: af['x'].map({1.: 'a', 2.: 'b'}).fillna('a')), AColumn('big', x * 1e10),
+               AColumn('wide', y * 2, dtype='int64'), AColumn('f32', x * 2, dtype='float32')]
+    data = {'x': [1., 2., 3., 4.], 'y': [1, 2, 3, 4]}
+    af = AFrame(data, compact=True)
+    af.materialize(columns)
+    assert af.dtypes[[c.name for c in columns]].astype(str).tolist() == \
+        ['float32', 'float32', 'float64', 'category', 'float64', 'int64', 'float32']
+    expected = AFrame(data)[columns]
+    assert all(af[c.name].tolist() == expected[c.name].tolist() for c in columns)
+    report = af.memory_report()
+    assert report.loc['flag', ['dtype', 'original_dtype', 'saved']].tolist() == ['float32', 'float64', 16]
+    assert report.loc['x', 'saved'] == 0 and report.loc['big', 'saved'] == 0
+    # the columns written by the user are not compacted
+    af['half'] = [0.5, 1., 1.5, 2.]
+    assert af.memory_report().loc['half', 'saved'] == 0 and af['half'].dtype == 'float64'
+    # the integral floats stay floats, so the arithmetic on them is not changed
+    af = AFrame({'x': [100, 120, 2]}, compact=True)
+    u = AColumn('u', AColumn('x') * 1.0)
+    assert af[AColumn('v', u * u)].tolist() == [10000., 14400., 4.]
+    assert np.allclose(af[AColumn('w', u ** -1)], [0.01, 1 / 120, 0.5])
+    assert af['u'].dtype == 'float32' and af['x'].dtype == 'int64'
+    # the lazy plans keep the options of the frame
+    x = AColumn('x')
+    s = AColumn('s', x + 1)
+    assert af[[s]]['s'].dtype == 'int8'
+    assert af.lazy().with_columns(s).collect()['s'].dtype == 'int8'
+    assert af.lazy().filter(x > 50).with_columns(s).collect()['s'].tolist() == [101, 121]
+    assert af.lazy().filter(x > 50).with_columns(s).collect()['s'].dtype == 'int8'
+    grouped = af.lazy().groupby(AColumn('i', x % 2)).agg('sum').collect()
+    assert grouped.compact and grouped[AColumn('t', x * 0 + 1)].dtype == 'int8'
+    # the AColumns calculated from the compacted ones read them in their original dtypes
+    af = AFrame({'x': [1., 2., 3.], 'y': [2, 3, 4]}, compact=True)
+    x, y = AColumn('x'), AColumn('y')
+    half, s = AColumn('half', x / 2), AColumn('s', y * 1)
+    af.materialize([half, s])
+    assert af['half'].dtype == 'float32' and af['s'].dtype == 'int8'
+    assert af[AColumn('big', half + 1e8)].tolist() == [1e8 + 0.5, 1e8 + 1, 1e8 + 1.5]
+    assert af[AColumn('hundreds', s * 100)].tolist() == [200, 300, 400]
+    # also within the pass calculating them and for the appended rows
+    af = AFrame({'x': [1., 2., 3.], 'y': [2, 3, 4]}, compact=True)
+    af.materialize([AColumn('big', half + 1e8), AColumn('hundreds', s * 100)])
+    assert af['big'].tolist() == [1e8 + 0.5, 1e8 + 1, 1e8 + 1.5] and af['hundreds'].tolist() == [200, 300, 400]
+    af.append_rows(pd.DataFrame({'x': [5.], 'y': [5]}))
+    assert af['big'].tolist()[-1] == 1e8 + 2.5 and af['hundreds'].tolist()[-1] == 500
+
+
+def test_invalidation(x_y_z_and_af):
+    x, y, z, af = x_y_z_and_af
+    u = AColumn('u', x + y)
+    w = AColumn('w', z - u)
+    v = AColumn('v', y * 2)
+    af.materialize([w, v])
+    assert af.version(z) == 1 and af.version('x') == 1
+    af[x] = [2, 3, 4]
+    assert af.version(x) == 2
+    # only the columns derived from x are stale and they are recalculated on the next access
+    assert af.is_stale(z) and af.is_stale(u) and af.is_stale(w) and not af.is_stale(v)
+    pd.testing.assert_series_equal(af[w].to_pandas(), pd.Series([7, 12, 17], name='w'))
+    assert af.version(z) == 2 and af.version(v) == 1
+    assert not af.is_stale(z) and not af.is_stale(w)
+    # also through the columns kept only in the scratch space
+    e = AColumn('e', x * 3, ephemeral=True)
+    f = AColumn('f', e + 1)
+    assert af[f].tolist() == [7, 10, 13]
+    af['x'] = [0, 0, 0]
+    assert af[f].tolist() == [1, 1, 1]
+
+    # override is per frame and per definition
+    o = AColumn('x', y + 1, override=True)
+    af2 = AFrame({'x': [1, 2, 3], 'y': [3, 3, 3]})
+    assert af[o].tolist() == [4, 4, 4]
+    assert af2[o].tolist() == [4, 4, 4]
+    af2[y] = [1, 1, 1]
+    assert af2[o].tolist() == [2, 2, 2]
+
+
+def test_invalidation_copies_and_indexers(x_y_z_and_af):
+    x, y, z, af = x_y_z_and_af
+    u = AColumn('u', z * 2)
+    af[u]
+    # the copies keep the tracking of the derived columns
+    af2 = af.copy()
+    assert not af2.is_stale(u)
+    af2['x'] = [10, 10, 10]
+    assert af2.is_stale(z) and af2.is_stale(u) and not af.is_stale(z)
+    assert af2[u].tolist() == [120, 120, 120] and af[u].tolist() == [12, 24, 36]
+    # the writes through the indexers are tracked
+    af.loc[:, 'x'] = [0, 0, 0]
+    assert af.is_stale(u) and af[u].tolist() == [0, 0, 0]
+    af.iloc[0, 0] = 1
+    assert af.is_stale(u) and af[u].tolist() == [12, 0, 0]
+    af.at[1, 'x'] = 2
+    assert af[u].tolist() == [12, 24, 0]
+    af.iat[0, 1] = 1
+    assert af[u].tolist() == [4, 24, 0]
+    af.loc[af['x'] > 0, ['x', 'y']] = 1
+    assert af[u].tolist() == [4, 4, 0]
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_materialize_parallel(executor, monkeypatch):
+    x = AColumn('x')
+    y = AColumn('y')
+    us = [AColumn(f'u{i}', x * i + y) for i in range(6)]
+    vs = [AColumn(f'v{i}', us[i] % 7) for i in range(6)]
+    # opaque python functions only on the source columns, they do not declare their dependencies
+    p = AColumn('p', lambda df: df['x'].map(lambda v: v * 2))
+    w = AColumn('w', us[0] + us[5] * 2, ephemeral=True)
+    t = AColumn('t', w - 1)
+    af = AFrame({'x': np.arange(20), 'y': np.arange(20) % 3})
+    expected = af.copy()
+    for acol in us + vs + [p, t]:
+        expected[acol.name] = expected[acol]
+    af.materialize(vs + [p, t], executor=executor, max_workers=3)
+    assert set(af.columns) == set(expected.columns) - {'w'}
+    pd.testing.assert_frame_equal(af.to_pandas(), expected.to_pandas()[af.columns])
+    with pytest.raises(ValueError):
+        af.materialize([AColumn('z', x + 1)], executor='foo')
+    # the workers are forked, the platforms without fork (Windows) need another executor
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    if executor == 'process':
+        with pytest.raises(ValueError, match="'fork'"):
+            af.materialize([AColumn('z', x + 1)], executor=executor)
+    else:
+        af.materialize([AColumn('z', x + 1)], executor=executor)
+        assert af['z'].tolist() == list(range(1, 21))
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_materialize_partitioned(executor):
+    x = AColumn('x')
+    y = AColumn('y')
+    u = AColumn('u', (x * 2 + y).round(1))
+    c = AColumn('c', (u - 1).cumsum() * 2 + x.diff(3) - y.diff(-2).fillna(0) + y.cumprod())
+    e = AColumn('e', u.cumsum().cumsum(), ephemeral=True)
+    r = AColumn('r', AFunction(lambda df: df['x'].map(lambda v: v % 5)).rowwise() + e)
+    s = AColumn('s', x.replace(3, -1).cumsum(skipna=False))
+    data = {'x': [1., 2., np.nan, 4., 5., 3., 7., np.nan, 9., 10., 11.],
+            'y': [1., 1.1, 0.9, np.nan, 1., 1.2, 0.8, 1., 1., 1.1, 0.9]}
+    expected = AFrame(data)
+    expected.materialize([u, c, r, s])
+    af = AFrame(data, partitions=4)
+    af.materialize([u, c, r, s], executor=executor, max_workers=2)
+    assert list(af.columns) == ['x', 'y', 'u', 'c', 'r', 's']
+    pd.testing.assert_frame_equal(af.to_pandas(), expected.to_pandas()[af.columns])
+
+
+def test_append_rows():
+    x = AColumn('x')
+    y = AColumn('y')
+    u = AColumn('u', (x * 2 + y).round(1))
+    k = AColumn('k', x.cumsum())
+    c = AColumn('c', (u - 1).cumsum() * 2 + x.diff(3) - y.diff().fillna(0) + y.cumprod())
+    e = AColumn('e', u.cumsum().cumsum(), ephemeral=True)
+    r = AColumn('r', AFunction(lambda df: df['x'].map(lambda v: v % 5)).rowwise() + e)
+    f = AColumn('f', e.diff() + e.cumsum() + (x * 2).diff(2))
+    # calculated again over all the rows
+    g = AColumn('g', y.group_sum('b') + k)
+    o = AColumn('o', lambda df: df['x'] - df['x'].mean())
+    acols = [u, k, c, r, f, g, o]
+    data = pd.DataFrame({'x': [1., 2., np.nan, 4., 5., 3., 7., np.nan, 9., 10., 11., 2.],
+                         'y': [1., 1.1, 0.9, np.nan, 1., 1.2, 0.8, 1., 1., 1.1, 0.9, 1.],
+                         'b': list('abab' * 3)})
+    af = AFrame(data.iloc[:4])
+    af.materialize(acols)
+    af.append_rows(data.iloc[4:5].reset_index(drop=True))
+    af.append_rows(data.iloc[5:9].reset_index(drop=True))
+    af[AColumn('d', k.diff(2) + x.cumsum())]
+    af.append_rows(data.iloc[9:].reset_index(drop=True))
+    expected = AFrame(data)
+    expected.materialize(acols + [AColumn('d', k.diff(2) + x.cumsum())])
+    pd.testing.assert_frame_equal(af.to_pandas(), expected.to_pandas()[af.columns])
+    assert isinstance(af.index, pd.RangeIndex) and not any(af.is_stale(acol) for acol in acols)
+    with pytest.raises(ValueError):
+        af.append_rows(data[['x', 'y']])
+
+
+def test_reuse_buffers(tmp_path):
+    from apandas.acompile import BufferArena
+    from apandas.aeval import evaluate
+    x, y = AColumn('x'), AColumn('y')
+    acols = [AColumn(f'c{i}', (np.sqrt(x * i + y) * (y - i) / (x + 1)).cumsum() - (x * i) ** 2 + (x > i))
+             for i in range(5)]
+    data = {'x': np.arange(10.), 'y': np.arange(10.) % 3}
+    expected = AFrame(data)
+    expected.materialize(acols)
+    path = str(tmp_path / 'store')
+    AFrame(data).to_mmap(path)
+    af = AFrame.open_mmap(path, reuse_buffers=True)
+    af.materialize(acols)
+    pd.testing.assert_frame_equal(af.to_pandas(), expected.to_pandas())
+    # the mapped columns are read-only and never written
+    assert af['x'].tolist() == data['x'].tolist() and not af['x'].to_numpy().flags.writeable
+    # the chain is calculated in a buffer of the arena, which is then recycled for the next calculation
+    arena = BufferArena()
+    af = AFrame(data)
+    first = evaluate(((x * 2 + 1) * 3 - y) / 2, af, arena=arena)
+    assert first.tolist() == (((af['x'] * 2 + 1) * 3 - af['y']) / 2).tolist()
+    assert arena.owns(first.to_numpy())
+    buffer = first.to_numpy()
+    arena.give(buffer)
+    second = evaluate(np.exp(x) + y, af, arena=arena)
+    assert second.tolist() == (np.exp(af['x']) + af['y']).tolist()
+    assert np.shares_memory(second.to_numpy(), buffer)
+
+
+def test_profiler(x_y_z_and_af, tmp_path):
+    x, y, z, af = x_y_z_and_af
+    u = AColumn('u', x + y)
+    w = AColumn('w', z - u)
+    with AProfiler(memory=True) as profiler:
+        af[w]
+        af[w]
+    af[AColumn('v', x * 2)]
+    assert [(e.name, e.chain, e.hit) for e in profiler.events] == [
+        ('z', ('w', 'z'), False), ('u', ('w', 'u'), False), ('w', ('w',), False), ('w', ('w',), True)]
+    assert all(e.timing.wall >= 0 and e.nbytes == 24 for e in profiler.events if not e.hit)
+    report = profiler.report(top=2)
+    assert len(report) == 2
+    # the order of the columns depends on their timings, all of them are in the full report
+    report = profiler.report(top=None)
+    assert len(report) == 3
+    assert report.loc['w', 'hits'] == 1 and report.loc['w', 'calculated'] == 1
+    assert report.loc['w', 'peak_memory'] is not None
+    path = str(tmp_path / 'trace.json')
+    trace = profiler.to_chrome_trace(path)
+    assert [e['name'] for e in trace['traceEvents']] == ['z', 'u', 'w']
+    with open(path) as f:
+        assert json.load(f) == trace
@@ -1,7 +1,8 @@
 import pytest
 import numpy as np
 import pandas as pd
-from apandas import ANamedFunction, AColumn, AFrame, ASeries
+from apandas import AFunction, ANamedFunction, AColumn, AFrame, ASeries
+import apandas.agroup
 
 
 @pytest.fixture()
@@ -124,4 +125,113 @@ def test_advanced_function(x_y_and_af):
     z = AColumn('z', x // two, override=True)
     magic = ANamedFunction('magic', lambda af: af.set_index(x, drop=False)[z % 2 != 0][x.diff()].rename(
         'x_diff').reset_index())
-    af[magic]
\ No newline at end of file
+    af[magic]
+
+
+def test_common_subexpressions(x_y_and_af):
+    x, y, af = x_y_and_af
+    # identical expressions have equal structural keys (even if built independently)
+    assert (x * y).key == (x * y).key
+    assert hash(x * y + 1) == hash(x * y + 1)
+    assert (x * y).key != (y * x).key
+    assert (x + 1).key != (x + 1.0).key
+
+    calls = []
+
+    def mul(a, b):
+        calls.append((a.name, b.name))
+        return a * b
+
+    xy = AFunction.function_wrapper(mul, x, y)
+    other_xy = AFunction.function_wrapper(mul, x, y)
+    z = AColumn('z', xy + other_xy)
+    w = AColumn('w', other_xy - 1)
+    af.materialize([z, w])
+    # x * y is calculated only once for both columns
+    assert calls == [('x', 'y')]
+    pd.testing.assert_series_equal(af[z], 2 * af[x] * af[y], check_names=False)
+    pd.testing.assert_series_equal(af[w], af[x] * af[y] - 1, check_names=False)
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'numexpr'])
+def test_compile(x_y_and_af, engine):
+    x, y, af = x_y_and_af
+    expr = (x * y + x * 2) / (abs(y) + 1) - (x ** 2)
+    z = AColumn('z', expr).compile(engine=engine)
+    pd.testing.assert_series_equal(af[z], expr(af), check_names=False)
+    # comparisons and boolean operators
+    f = ((x > 0) | (y > 2)) & (x != y)
+    pd.testing.assert_series_equal(f.compile(engine=engine)(af), f(af))
+    # the unsupported operations are evaluated by pandas
+    f = (x * y).diff() + x.cumsum() * 2
+    pd.testing.assert_series_equal(f.compile(engine=engine)(af), f(af))
+    # engine can be also set on the frame
+    af_engine = AFrame(af, engine=engine)
+    w = AColumn('w', expr)
+    pd.testing.assert_series_equal(af_engine[w], af[z], check_names=False)
+    with pytest.raises(ValueError):
+        x.compile(engine='foo')
+    with pytest.raises(ValueError):
+        AFrame(af, engine='foo')
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'numexpr'])
+def test_compile_dtypes(engine):
+    af = AFrame({'i': np.arange(-3, 4), 'i32': np.arange(-3, 4, dtype='int32'),
+                 'f32': np.linspace(-1, 1, 7, dtype='float32'), 'u8': np.arange(7, dtype='uint8')})
+    i, i32, f32, u8 = AColumn('i'), AColumn('i32'), AColumn('f32'), AColumn('u8')
+    exprs = [abs(i) + 1, f32 * 2.5, i32 + i32, i32 * 2 - 1, i32 / 2, abs(f32) + f32, u8 + u8, u8 * 2, i32 > 0,
+             (i + 1) ** 2, np.sqrt(abs(f32)) + f32, np.where(i32 > 0, i32, i32 * 2)]
+    for expr in exprs:
+        expected = expr(af)
+        result = expr.compile(engine=engine)(af)
+        assert result.dtype == expected.dtype
+        pd.testing.assert_series_equal(result, expected, check_names=False, check_series_type=False)
+
+
+@pytest.mark.parametrize('engine', [None, 'numpy', 'numexpr'])
+def test_numpy(x_y_and_af, engine):
+    x, y, af = x_y_and_af
+    df = pd.DataFrame(af)
+    exprs = [
+        (np.log1p(abs(x)) + np.sqrt(abs(y)), np.log1p(df['x'].abs()) + np.sqrt(df['y'].abs())),
+        (np.maximum(x, y) * 2, np.maximum(df['x'], df['y']) * 2),
+        (np.where(x > y, x, y * 1.5), pd.Series(np.where(df['x'] > df['y'], df['x'], df['y'] * 1.5))),
+        (np.clip(x, -1, 2) - np.add(1, y), df['x'].clip(-1, 2) - (1 + df['y'])),
+        # reductions are nodes of the expression as well
+        ((x - x.mean()) / np.std(x), (df['x'] - df['x'].mean()) / df['x'].std(ddof=0)),
+    ]
+    for expr, expected in exprs:
+        expr = expr if engine is None else expr.compile(engine=engine)
+        pd.testing.assert_series_equal(expr(af), expected, check_names=False, check_series_type=False)
+    assert np.sum(x)(af) == x.sum()(af) == 0 and np.sum(x).key == x.sum().key
+    assert np.log(x).key == np.log(x).key and np.log(x).key != np.log10(x).key
+    assert [acol.name for acol in (np.exp(x) + np.mean(y)).dependencies] == ['x', 'y']
+    with pytest.raises(TypeError):
+        np.sum(x, axis=1)
+
+
+def test_group_transform(monkeypatch):
+    af = AFrame({'g': [1, 1, 2, 2, np.nan, 2], 'h': list('abaaab'), 'x': [1., 2., np.nan, 4., 5., 6.],
+                 'i': [1, 2, 3, 4, 5, 6]})
+    df = pd.DataFrame(af)
+    x, g, h, i = AColumn('x'), AColumn('g'), AColumn('h'), AColumn('i')
+    for func in ['sum', 'mean', 'min', 'max', 'count', 'size', 'std']:
+        for by in [['g'], ['g', 'h'], ['h']]:
+            for col in [x, i]:
+                expected = df.groupby(by)[col.name].transform(func)
+                pd.testing.assert_series_equal(col.group_transform(func, by)(af), expected,
+                                               check_series_type=False)
+    pd.testing.assert_series_equal(x.group_rank(by=g)(af), df.groupby('g')['x'].rank(),
+                                   check_series_type=False)
+    share = AColumn('share', x / x.group_sum(by=g))
+    pd.testing.assert_series_equal(af[share], df['x'] / df.groupby('g')['x'].transform('sum'),
+                                   check_names=False, check_series_type=False)
+    # all the grouped functions with the same keys share a single factorization of the keys
+    groupings = []
+    original = apandas.agroup.AGrouping
+    monkeypatch.setattr(apandas.agroup, 'AGrouping', lambda keys: groupings.append(keys) or original(keys))
+    stats = [AColumn('mean', x.group_mean(by=g)), AColumn('rank', i.group_rank(by=g)),
+             AColumn('dev', x - x.group_mean(by=g)), AColumn('n', x.group_size(by=[h]))]
+    AFrame(df).materialize(stats)
+    assert len(groupings) == 2
@@ -0,0 +1,68 @@
+import pytest
+import numpy as np
+import pandas as pd
+from apandas import AColumn, AFrame, AFunction, stream, write_stream
+
+
+@pytest.fixture()
+def x_y_and_df():
+    x = AColumn('x')
+    y = AColumn('y')
+    df = pd.DataFrame({'x': np.arange(10), 'y': [1.5, np.nan, 2., 3., np.nan, 1., 2., 0.5, 4., 1.]})
+    return x, y, df
+
+
+def test_stream(x_y_and_df, tmp_path):
+    x, y, df = x_y_and_df
+    u = AColumn('u', x * y + 1)
+    c = AColumn('c', u.cumsum())
+    d = AColumn('d', x.diff(2) + y.diff())
+    p = AColumn('p', (y / 2).cumprod())
+    columns = ['x', u, c, d, p]
+    expected = AFrame(df)[columns].to_pandas()
+
+    path = str(tmp_path / 'data.csv')
+    df.to_csv(path, index=False)
+    chunks = list(stream(path, columns, chunksize=3))
+    assert len(chunks) == 4
+    assert all(isinstance(chunk, AFrame) for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks).to_pandas(), expected)
+
+    # iterables of frames and writing the results
+    out = str(tmp_path / 'out.csv')
+    assert write_stream(stream((df.iloc[i:i + 4] for i in range(0, 10, 4)), columns), out) == 10
+    pd.testing.assert_frame_equal(pd.read_csv(out), expected)
+
+    with pytest.raises(NotImplementedError):
+        list(stream([df.iloc[:5], df.iloc[5:]], [AColumn('e', x.diff(-1))]))
+    with pytest.raises(NotImplementedError):
+        list(stream([df.iloc[:5], df.iloc[5:]], [AColumn('s', y / y.group_sum(by=x % 2))]))
+    with pytest.raises(NotImplementedError):
+        list(stream([df.iloc[:5], df.iloc[5:]], [AColumn('m', y - np.mean(y))]))
+    # the operations filling the values from the previous rows cannot be streamed, the constant filling can
+    with pytest.raises(NotImplementedError, match="'f'"):
+        list(stream([df.iloc[:5], df.iloc[5:]], [AColumn('f', y.fillna(method='ffill'))]))
+    # the opaque functions are applied chunk by chunk, so they have to be declared row-wise
+    with pytest.raises(NotImplementedError, match="'m'"):
+        list(stream([df.iloc[:5], df.iloc[5:]], [AColumn('m', lambda af: af['x'] - af['x'].mean())]))
+    g = AColumn('g', y.fillna(0) + 1)
+    o = AColumn('o', AFunction(lambda af: af['x'] * 2).rowwise())
+    pd.testing.assert_frame_equal(pd.concat(stream([df.iloc[:5], df.iloc[5:]], [g, o])).to_pandas(),
+                                  AFrame(df)[[g, o]].to_pandas())
+
+
+def test_stream_parquet(x_y_and_df, tmp_path):
+    pytest.importorskip('pyarrow')
+    x, y, df = x_y_and_df
+    c = AColumn('c', (x + y).cumsum())
+    path = str(tmp_path / 'data.parquet')
+    df.to_parquet(path, index=False)
+    out = str(tmp_path / 'out.parquet')
+    assert write_stream(stream(path, [x, c], chunksize=4), out) == 10
+    pd.testing.assert_frame_equal(pd.read_parquet(out), AFrame(df)[[x, c]].to_pandas())
+    # only the selected source columns are read
+    chunks = list(stream(path, [x, AColumn('d', x * 2)], chunksize=4, read_columns=['x']))
+    assert all(list(chunk.columns) == ['x', 'd'] for chunk in chunks)
+    assert pd.concat(chunks)['d'].tolist() == list(range(0, 20, 2))
+    with pytest.raises(KeyError):
+        list(stream(path, [y], chunksize=4, read_columns=['x']))